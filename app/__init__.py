@@ -1,21 +1,37 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi_jwt_auth.exceptions import AuthJWTException
 from fastapi_pagination import add_pagination
 
-from .auth import authjwt_openapi, authjwt_exception_handler
-from .middleware import CORSOnAllMiddleware
+from . import metrics, openapi
+from .auth import authjwt_exception_handler
+from .cache import balance_cache, claims_cache, count_cache
+from .conf import settings
+from .mail import mail_templates, outbox_worker
+from .middleware import CORSMiddleware
+from .revocation import revocation_list
 from .routers import router
+from .routers.users import password_request_limiter
+from .util.hashing import password_hasher
 
 # Uncomment below for MongoDB
 #from . import mongodb
 
 # Uncomment below for SQL
-#from . import sql
+from . import sql
 
 
 app = FastAPI(
     title="FastAPI Skeretonu API",
     version="0.1.0",
+    default_response_class=ORJSONResponse,
+    # Served pre-serialized by `openapi.setup`
+    openapi_url=None,
+    docs_url=None,
+    redoc_url=None
+)
+openapi_document = openapi.setup(
+    app,
     openapi_url="/api/v1/specs/openapi.json",
     docs_url="/api/v1/specs/swagger/",
     redoc_url="/api/v1/specs/redoc/"
@@ -26,20 +42,48 @@ app = FastAPI(
 #mongodb.setup(app)
 
 # Uncomment below for SQL
-#app.on_event('startup')(sql.init)
+app.on_event('startup')(sql.init)
+app.on_event('shutdown')(sql.dispose)
+app.on_event('startup')(revocation_list.init)
+
+
+app.on_event('shutdown')(password_hasher.shutdown)
 
+# Off on serverless, templates are then loaded on first use
+if settings.mail_templates_preload:
+    app.on_event('startup')(mail_templates.load_all)
+
+if settings.mail_outbox_worker:
+    app.on_event('startup')(outbox_worker.start)
+    app.on_event('shutdown')(outbox_worker.stop)
 
 app.exception_handler(AuthJWTException)(authjwt_exception_handler)
 origins = ['*']
 
 app.include_router(router)
 app.add_middleware(
-    CORSOnAllMiddleware,
+    CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Read-your-writes window, see `util.sql.get_session`
+    expose_headers=["X-Last-Write"],
+    max_age=settings.cors_max_age,
 )
 
-authjwt_openapi(app)
+if settings.metrics_enabled:
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.on_event('startup')(metrics.registry.start)
+    app.on_event('shutdown')(metrics.registry.stop)
+
+    metrics.registry.register_collector(metrics.pool_collector)
+    metrics.registry.register_collector(metrics.revocation_collector)
+    metrics.registry.register_collector(metrics.cache_collector('balance', balance_cache))
+    metrics.registry.register_collector(metrics.cache_collector('count', count_cache))
+    metrics.registry.register_collector(metrics.cache_collector('jwt_claims', claims_cache))
+    metrics.registry.register_collector(
+        metrics.limiter_collector('password_request', password_request_limiter)
+    )
+
 add_pagination(app)
@@ -1,15 +1,30 @@
-import inspect
-import os
-import re
+import time
+from typing import Any, Dict, Optional, Union
 
-from fastapi import Request
-from fastapi.openapi.utils import get_openapi
+from fastapi import Depends, Request, Security
 from fastapi.responses import ORJSONResponse as JSONResponse
-from fastapi.routing import APIRoute
+from fastapi.security import APIKeyHeader
 from fastapi_jwt_auth import AuthJWT
-from fastapi_jwt_auth.exceptions import AuthJWTException
+from fastapi_jwt_auth.exceptions import AuthJWTException, RevokedTokenError
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from .cache import claims_cache
 from .conf import settings
+from .revocation import revocation_list
+from .util import token_digest
+from .util.sql import get_session
+
+__all__ = (
+    'bearer_scheme', 'get_config', 'authjwt_exception_handler', 'JWTClaims',
+    'reject_revoked', 'jwt_required', 'jwt_optional', 'jwt_refresh_required'
+)
+
+bearer_scheme = APIKeyHeader(
+    name="Authorization",
+    scheme_name="Bearer Auth",
+    description="Enter: **'Bearer &lt;JWT&gt;'**, where JWT is the access token",
+    auto_error=False
+)
 
 
 @AuthJWT.load_config
@@ -24,47 +39,75 @@ def authjwt_exception_handler(request: Request, exc: AuthJWTException):
     )
 
 
-def authjwt_openapi(app):
-    def custom_openapi():
-        if app.openapi_schema:
-            return app.openapi_schema
-
-        openapi_schema = get_openapi(
-            title=app.title,
-            version=app.version,
-            description=app.description,
-            routes=app.routes,
-        )
-
-        openapi_schema["components"]["securitySchemes"] = {
-            "Bearer Auth": {
-                "type": "apiKey",
-                "in": "header",
-                "name": "Authorization",
-                "description": "Enter: **'Bearer &lt;JWT&gt;'**, where JWT is the access token"
-            }
-        }
-
-        # Get all routes where jwt_optional() or jwt_required
-        api_router = [route for route in app.routes if isinstance(route, APIRoute)]
-
-        for route in api_router:
-            path = getattr(route, "path")
-            endpoint = getattr(route, "endpoint")
-            methods = [method.lower() for method in getattr(route, "methods")]
-
-            for method in methods:
-                # access_token
-                if (
-                    re.search(
-                        "\.\s*((fresh_)?jwt_)(required|ptional)",
-                        inspect.getsource(endpoint),
-                        flags=re.DOTALL | re.UNICODE | re.MULTILINE
-                    )
-                ):
-                    openapi_schema["paths"][path][method]["security"] = [{"Bearer Auth": []}]
-
-        app.openapi_schema = openapi_schema
-        return app.openapi_schema
-
-    app.openapi = custom_openapi
+class JWTClaims:
+    """
+    Verified claims of the access token, with the `AuthJWT` getters the
+    routes use.
+    """
+    __slots__ = ('raw',)
+
+    def __init__(self, raw: Dict[str, Any]):
+        self.raw = raw
+
+    def get_jwt_subject(self) -> Optional[Union[str, int]]:
+        return self.raw.get('sub')
+
+    def get_raw_jwt(self) -> Dict[str, Any]:
+        return self.raw
+
+
+async def reject_revoked(db: AsyncSession, raw: Dict[str, Any]):
+    if raw.get('jti') and await revocation_list.is_revoked(db, raw['jti'], raw.get('exp', 0)):
+        raise RevokedTokenError(status_code=401, message="Token has been revoked")
+
+
+async def jwt_required(
+    auth: AuthJWT = Depends(), authorization: Optional[str] = Security(bearer_scheme),
+    db: AsyncSession = Depends(get_session)
+) -> JWTClaims:
+    """
+    Requires a valid access token, declared as a security dependency
+    so the OpenAPI schema knows the route needs the Bearer token.
+
+    Verified claims are cached by the digest of the header until the
+    token expires, so a token is decoded and its signature checked
+    once, not on every request and every claim read. Revocation is
+    checked every time, mostly from memory.
+    """
+    key = token_digest(authorization) if authorization else None
+    claims: Optional[JWTClaims] = await claims_cache.get(key) if key else None
+
+    if claims is None:
+        auth.jwt_required()
+        claims = JWTClaims(auth.get_raw_jwt())
+
+        if key:
+            ttl = min(
+                claims.raw.get('exp', 0) - time.time(),
+                settings.jwt_claims_cache_ttl
+            )
+
+            if ttl > 0:
+                await claims_cache.set(key, claims, ttl)
+
+    await reject_revoked(db, claims.raw)
+
+    return claims
+
+
+async def jwt_optional(
+    auth: AuthJWT = Depends(), authorization: Optional[str] = Security(bearer_scheme)
+) -> AuthJWT:
+    """
+    Documents the Bearer token, the route decides whether to require it.
+    """
+    return auth
+
+
+async def jwt_refresh_required(
+    auth: AuthJWT = Depends(), authorization: Optional[str] = Security(bearer_scheme),
+    db: AsyncSession = Depends(get_session)
+) -> AuthJWT:
+    auth.jwt_refresh_token_required()
+    await reject_revoked(db, auth.get_raw_jwt())
+    return auth
@@ -0,0 +1,158 @@
+from typing import NamedTuple, Optional, Sequence, Set, Union
+
+from fastapi import HTTPException
+from sqlalchemy import literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from . import models
+from .auth import JWTClaims
+
+__all__ = (
+    'AccountAccess', 'jwt_role', 'resolve_account_access', 'resolve_role', 'owned_accounts',
+    'roles_or_403', 'roles_or_account_owner_or_403'
+)
+
+
+class AccountAccess(NamedTuple):
+    role: Optional[str]
+    account_exists: bool
+    is_owner: bool
+    enabled: bool
+
+
+def _memo(db: AsyncSession) -> dict:
+    # The session lives as long as the request, so does the memo
+    return db.info.setdefault('authorization', {})
+
+
+def jwt_role(auth: JWTClaims) -> Optional[str]:
+    """
+    Role embedded in the token claims by `create_token_response`.
+    """
+    return auth.get_raw_jwt().get('role')
+
+
+async def resolve_role(db: AsyncSession, user_id: Union[int, str]) -> Optional[str]:
+    memo = _memo(db)
+    key = ('role', int(user_id))
+
+    if key not in memo:
+        memo[key] = (
+            await db.execute(
+                select(models.db.User.role)
+                    .where(models.db.User.id == int(user_id))
+            )
+        )\
+            .scalar_one_or_none()
+
+    return memo[key]
+
+
+async def resolve_account_access(
+    db: AsyncSession, user_id: Union[int, str], account_number: str
+) -> AccountAccess:
+    """
+    Role of the user, ownership and enabled state of the account in one
+    joined query, memoized for the rest of the request.
+    """
+    memo = _memo(db)
+    key = ('account', int(user_id), account_number)
+
+    if key not in memo:
+        User = models.db.User
+        Account = models.db.Account
+        UserAccounts = models.db.UserAccounts
+
+        row = (
+            await db.execute(
+                select(
+                    User.role,
+                    Account.number.label('account_number'),
+                    Account.enabled,
+                    UserAccounts.id.label('user_account_id')
+                )
+                    .select_from(User)
+                    .outerjoin(Account, Account.number == literal(account_number))
+                    .outerjoin(
+                        UserAccounts,
+                        (UserAccounts.user_id == User.id)
+                        & (UserAccounts.account_number == Account.number)
+                    )
+                    .where(User.id == int(user_id))
+                    .limit(1)
+            )
+        )\
+            .first()
+
+        memo[key] = AccountAccess(
+            role=row.role if row else None,
+            account_exists=bool(row and row.account_number is not None),
+            is_owner=bool(row and row.user_account_id is not None),
+            enabled=bool(row and row.enabled)
+        )
+        memo[('role', int(user_id))] = memo[key].role
+
+    return memo[key]
+
+
+async def owned_accounts(
+    db: AsyncSession, user_id: Union[int, str], account_numbers: Sequence[str]
+) -> Set[str]:
+    """
+    Which of `account_numbers` belong to the user, in one `IN` query.
+    """
+    UserAccounts = models.db.UserAccounts
+
+    return set(
+        (
+            await db.execute(
+                select(UserAccounts.account_number)
+                    .where(
+                        (UserAccounts.user_id == int(user_id))
+                        & (UserAccounts.account_number.in_(account_numbers))
+                    )
+            )
+        )\
+            .scalars()\
+            .all()
+    )
+
+
+async def roles_or_403(
+    db: AsyncSession, roles: Sequence[str],
+    user_id: Union[int, str], role: Optional[str] = None
+) -> str:
+    """
+    When the role comes from the token claims no query is needed.
+    """
+    if role is None:
+        role = await resolve_role(db, user_id)
+
+    if role not in roles:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    return role
+
+
+async def roles_or_account_owner_or_403(
+    db: AsyncSession, roles: Sequence[str],
+    user_id: Union[int, str], account_number: str,
+    check_enabled: bool = False, role: Optional[str] = None
+):
+    if role is not None and role in roles:
+        return
+
+    access = await resolve_account_access(db, user_id, account_number)
+
+    if access.role in roles:
+        return
+
+    if not access.account_exists:
+        raise HTTPException(404)
+
+    if not access.is_owner:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    if check_enabled and not access.enabled:
+        raise HTTPException(423, detail="Account disabled")
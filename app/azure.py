@@ -2,8 +2,9 @@ import azure.functions as func
 from azure.functions._http_asgi import AsgiResponse, AsgiRequest
 
 from . import app
+from .startup import StartupOnce
 
-app_init = False
+startup = StartupOnce(app)
 
 
 async def handle_asgi_request(req: func.HttpRequest, context: func.Context) -> func.HttpResponse:
@@ -14,10 +15,6 @@ async def handle_asgi_request(req: func.HttpRequest, context: func.Context) -> f
 
 
 async def main(req: func.HttpRequest, context: func.Context) -> func.HttpResponse:
-    global app_init
-
-    if not app_init:
-        await app.router.startup()
-        app_init = True
+    await startup()
 
     return await handle_asgi_request(req, context)
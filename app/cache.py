@@ -0,0 +1,141 @@
+import abc
+import importlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple, Type
+
+from .conf import settings
+
+__all__ = (
+    'CacheBackend', 'LRUCache', 'register_backend', 'create_cache',
+    'balance_cache', 'count_cache', 'claims_cache'
+)
+
+
+class CacheBackend(abc.ABC):
+    """
+    Cache interface, `None` is never a cached value so a miss is
+    just `None`. Shared stores implement `_get`, `set` and `delete`.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: Hashable) -> Optional[Any]:
+        value = await self._get(key)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    async def peek(self, key: Hashable) -> Optional[Any]:
+        """
+        Lookup without touching the hit/miss counters, for write-through.
+        """
+        return await self._get(key)
+
+    @abc.abstractmethod
+    async def _get(self, key: Hashable) -> Optional[Any]:
+        pass
+
+    @abc.abstractmethod
+    async def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        pass
+
+    @abc.abstractmethod
+    async def delete(self, key: Hashable):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=(self.hits / lookups) if lookups else 0.0
+        )
+
+
+class LRUCache(CacheBackend):
+    """
+    In-process LRU with TTL, entries are expired lazily on lookup.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        super().__init__(maxsize, ttl)
+        self._data: "OrderedDict[Hashable, Tuple[Optional[float], Any]]" = OrderedDict()
+        self.evictions = 0
+
+    async def _get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+
+        if item is None:
+            return None
+
+        expires, value = item
+
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = ttl if ttl is not None else self.ttl
+
+        self._data[key] = ((time.monotonic() + ttl) if ttl else None, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            super().stats(),
+            size=len(self._data),
+            evictions=self.evictions
+        )
+
+
+_backends: Dict[str, Type[CacheBackend]] = {
+    'memory': LRUCache,
+}
+
+
+def register_backend(name: str, backend: Type[CacheBackend]):
+    _backends[name] = backend
+
+
+def create_cache(backend: str, maxsize: int, ttl: Optional[float]) -> CacheBackend:
+    """
+    `backend` is a registered name or a `package.module:Class` path.
+    """
+    if backend in _backends:
+        backend_class = _backends[backend]
+    else:
+        module, _, name = backend.partition(':')
+        backend_class = getattr(importlib.import_module(module), name)
+
+    return backend_class(maxsize=maxsize, ttl=ttl)
+
+
+balance_cache = create_cache(
+    settings.balance_cache_backend,
+    settings.balance_cache_size,
+    settings.balance_cache_ttl
+)
+count_cache = create_cache('memory', 64, settings.list_count_cache_ttl)
+
+# In-process only, cached claims must not leave the worker
+claims_cache = LRUCache(settings.jwt_claims_cache_size, settings.jwt_claims_cache_ttl)
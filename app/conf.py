@@ -7,9 +7,78 @@ from pydantic import BaseSettings
 class Settings(BaseSettings):
     app_secret_key: str
     authjwt_secret_key: Optional[str]
+    jwt_claims_cache_size: int = 10000
+    jwt_claims_cache_ttl: float = 300.0
+    jwt_denylist_bucket_seconds: int = 3600
+    jwt_denylist_error_rate: float = 0.001
+    jwt_denylist_sync_seconds: float = 5.0
     database_default_url: str
     sql_echo: str = 'no'
 
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout: float = 30.0
+    database_pool_recycle: int = 1800
+    database_pool_pre_ping: bool = True
+
+    # Comma separated, reads are spread over them
+    database_replica_urls: str = ''
+    database_replica_eject_seconds: float = 30.0
+    database_read_your_writes_seconds: float = 5.0
+
+    password_hash_algorithm: str = 'sha256'
+    password_hash_iterations: int = 512
+    password_hash_workers: int = 4
+    password_hash_executor: str = 'thread'
+
+    batch_get_max_keys: int = 100
+    bulk_posting_max_items: int = 5000
+    list_count_cache_ttl: float = 60.0
+
+    user_create_without_auth: str = 'no'
+    # Held across workers, each accepted request costs one indexed query
+    # of the requests of the day
+    user_password_request_max_per_day: int = 3
+    user_password_request_expires: int = 60
+    frontend_change_password_url: str = ''
+
+    mail_from: str = ''
+    mail_from_name: str = 'Banku'
+    mail_pass: str = ''
+    mail_smtp_host: str = 'smtp.gmail.com'
+    mail_smtp_port: int = 587
+    mail_smtp_tls: bool = True
+    mail_smtp_user: Optional[str]
+    mail_smtp_timeout: float = 30.0
+
+    mail_templates_hot_reload: bool = False
+    mail_templates_preload: bool = True
+
+    mail_outbox_worker: bool = True
+    mail_outbox_batch_size: int = 50
+    mail_outbox_max_attempts: int = 8
+    mail_outbox_backoff_seconds: float = 30.0
+    mail_outbox_poll_seconds: float = 5.0
+    mail_outbox_lease_seconds: int = 300
+
+    balance_checkpoint_interval: int = 1000
+    balance_checkpoint_settle_seconds: int = 60
+
+    statement_chunk_size: int = 1000
+
+    openapi_path: str = ''
+
+    cors_max_age: int = 7200
+
+    metrics_enabled: bool = True
+    metrics_multiprocess_dir: str = ''
+    metrics_flush_seconds: float = 5.0
+    metrics_token: str = ''
+
+    balance_cache_backend: str = 'memory'
+    balance_cache_size: int = 10000
+    balance_cache_ttl: float = 5.0
+
     class Config:
         env_file = os.path.abspath(
             os.path.join(os.path.dirname(__file__), '..', '.env')
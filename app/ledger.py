@@ -0,0 +1,470 @@
+import asyncio
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import func, insert, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import Select
+
+from . import models
+from .cache import balance_cache
+from .conf import settings
+from .util import the_ts_now
+
+
+class Posting(NamedTuple):
+    account_number: str
+    amount: float
+    description: str = ''
+    document: Optional[str] = None
+
+
+class PostingResult(NamedTuple):
+    status: int
+    detail: Optional[str] = None
+    transaction: Optional[models.db.AccountTransaction] = None
+
+
+NOT_POSTED = PostingResult(424, "Not posted, another posting of the batch was rejected")
+CONCURRENT_UPDATE = PostingResult(409, "The account changed concurrently, retry the posting")
+
+
+async def cached_account(db: AsyncSession, account_number: str) -> Optional[dict]:
+    """
+    The account from the balance cache, or from `db`. Only primary
+    sessions fill the cache, a lagging replica would share a stale
+    balance with every worker.
+    """
+    account = await balance_cache.get(account_number)
+
+    if account is None:
+        db_row = (
+            await db.execute(
+                select(models.db.Account)
+                    .where(models.db.Account.number == account_number)
+            )
+        )\
+            .scalars()\
+            .first()
+
+        if db_row is None:
+            return None
+
+        account = db_row.dict()
+
+        if not db.info.get('replica'):
+            await balance_cache.set(account_number, account)
+
+    return account
+
+
+async def latest_checkpoint(
+    db: AsyncSession, account_number: str, before_ts: Optional[int] = None
+) -> Optional[models.db.AccountBalanceCheckpoint]:
+    AccountBalanceCheckpoint = models.db.AccountBalanceCheckpoint
+    where = (AccountBalanceCheckpoint.account_number == account_number)
+
+    if before_ts:
+        where &= (AccountBalanceCheckpoint.date < before_ts)
+
+    return (
+        await db.execute(
+            select(AccountBalanceCheckpoint)
+                .where(where)
+                .order_by(
+                    AccountBalanceCheckpoint.date.desc(),
+                    AccountBalanceCheckpoint.up_to_tx_id.desc()
+                )
+                .limit(1)
+        )
+    )\
+        .scalars()\
+        .first()
+
+
+async def balance_at(
+    db: AsyncSession, account_number: str, before_ts: Optional[int] = None
+) -> float:
+    """
+    Account amount right before `before_ts` (or now), the nearest
+    checkpoint plus the transactions after it.
+    """
+    AccountTransaction = models.db.AccountTransaction
+    checkpoint = await latest_checkpoint(db, account_number, before_ts)
+    where = (AccountTransaction.account_number == account_number)
+    balance = 0.0
+
+    if checkpoint:
+        balance = checkpoint.balance
+        where &= (
+            tuple_(AccountTransaction.date, AccountTransaction.id)
+            > tuple_(checkpoint.date, checkpoint.up_to_tx_id)
+        )
+
+    if before_ts:
+        where &= (AccountTransaction.date < before_ts)
+
+    return balance + (
+        await db.execute(
+            select(func.coalesce(func.sum(AccountTransaction.amount), 0.0))
+                .where(where)
+        )
+    )\
+        .scalar_one()
+
+
+async def opening_balance(
+    db: AsyncSession, account_number: str, before_ts: Optional[int]
+) -> float:
+    if not before_ts:
+        return 0.0
+
+    return await balance_at(db, account_number, before_ts)
+
+
+def running_balance_query(
+    account_number: str, account_amount: float,
+    start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+    after: Optional[Tuple[int, int]] = None,
+    columns: Optional[Sequence[Any]] = None
+) -> Select:
+    """
+    Transactions ordered by `(date, id)` with the running account amount
+    from `account_amount`, an index range scan resumed `after` a
+    `(date, id)` keyset. `columns` selects plain columns instead of the
+    `AccountTransaction` entity.
+    """
+    AccountTransaction = models.db.AccountTransaction
+    where = (AccountTransaction.account_number == account_number)
+
+    if start_ts:
+        where &= (AccountTransaction.date >= start_ts)
+
+    if end_ts:
+        where &= (AccountTransaction.date <= end_ts)
+
+    if after:
+        where &= (
+            tuple_(AccountTransaction.date, AccountTransaction.id)
+            > tuple_(*after)
+        )
+
+    sort_key = (AccountTransaction.date, AccountTransaction.id)
+
+    return select(
+        *(columns or (AccountTransaction,)),
+        (
+            account_amount + func.sum(AccountTransaction.amount)
+                .over(order_by=sort_key, rows=(None, 0))
+        )
+            .label('account_amount')
+    ) \
+        .where(where) \
+        .order_by(*sort_key)
+
+
+async def checkpoint_account(
+    db: AsyncSession, account_number: str,
+    interval: Optional[int] = None
+) -> int:
+    """
+    Creates a checkpoint every `interval` transactions since the last
+    one. Only transactions older than the settle window are included,
+    so a posting that commits late can't land behind a checkpoint.
+    """
+    AccountTransaction = models.db.AccountTransaction
+    interval = interval or settings.balance_checkpoint_interval
+
+    checkpoint = await latest_checkpoint(db, account_number)
+    where = (
+        (AccountTransaction.account_number == account_number)
+        & (AccountTransaction.date < the_ts_now() - settings.balance_checkpoint_settle_seconds)
+    )
+    balance = 0.0
+
+    if checkpoint:
+        balance = checkpoint.balance
+        where &= (
+            tuple_(AccountTransaction.date, AccountTransaction.id)
+            > tuple_(checkpoint.date, checkpoint.up_to_tx_id)
+        )
+
+    sort_key = (AccountTransaction.date, AccountTransaction.id)
+    running = select(
+        AccountTransaction.id, AccountTransaction.date,
+        (
+            balance + func.sum(AccountTransaction.amount)
+                .over(order_by=sort_key, rows=(None, 0))
+        )
+            .label('balance'),
+        func.row_number().over(order_by=sort_key).label('position')
+    ) \
+        .where(where) \
+        .subquery()
+
+    rows = (
+        await db.execute(
+            select(running.c.id, running.c.date, running.c.balance)
+                .where(running.c.position % interval == 0)
+                .order_by(running.c.position)
+        )
+    )\
+        .all()
+
+    if rows:
+        await db.execute(
+            insert(models.db.AccountBalanceCheckpoint),
+            [
+                dict(
+                    account_number=account_number, up_to_tx_id=row.id,
+                    date=row.date, balance=row.balance
+                )
+                for row in rows
+            ]
+        )
+        await db.commit()
+
+    return len(rows)
+
+
+async def checkpoint_accounts(db: AsyncSession, interval: Optional[int] = None) -> int:
+    numbers = (
+        await db.execute(select(models.db.Account.number))
+    )\
+        .scalars()\
+        .all()
+
+    created = 0
+
+    for number in numbers:
+        created += await checkpoint_account(db, number, interval)
+
+    return created
+
+
+async def post_transaction(
+    db: AsyncSession, account_number: str, amount: float,
+    user_id: Optional[int] = None, description: str = '',
+    document: Optional[str] = None
+) -> models.db.AccountTransaction:
+    """
+    Applies `amount` to the account and writes the ledger row in the
+    same database transaction. The minimum amount check and the balance
+    update are a single conditional `UPDATE`, so concurrent postings
+    can't lose updates nor overdraw the account.
+    """
+    Account = models.db.Account
+    current_amount = func.coalesce(Account.current_amount, 0.0)
+    where = (Account.number == account_number) & (Account.enabled == True)
+
+    if amount < 0:
+        where &= (current_amount + amount >= func.coalesce(Account.min_amount, 0.0))
+
+    posted = (
+        await db.execute(
+            update(Account)
+                .where(where)
+                .values(current_amount=current_amount + amount)
+                .returning(Account.current_amount)
+                .execution_options(synchronize_session=False)
+        )
+    )\
+        .first()
+
+    if posted is None:
+        await db.rollback()
+        await balance_cache.delete(account_number)
+        await _posting_rejected(db, account_number)
+
+    transaction = models.db.AccountTransaction(
+        account_number=account_number,
+        user=user_id,
+        description=description,
+        document=document,
+        amount=amount
+    )
+    db.add(transaction)
+
+    await db.commit()
+
+    cached = await balance_cache.peek(account_number)
+
+    if cached is not None:
+        await balance_cache.set(
+            account_number, dict(cached, current_amount=posted.current_amount)
+        )
+
+    return transaction
+
+
+async def post_transactions(
+    db: AsyncSession, postings: Sequence[Posting],
+    user_id: Optional[int] = None, atomic: bool = True
+) -> List[PostingResult]:
+    """
+    Applies `postings` in order in one database transaction, with one
+    conditional `UPDATE` of the total delta per account and one
+    multi-row `INSERT` of the ledger rows. When `atomic` a rejected
+    posting rolls back the batch, otherwise only it is skipped.
+    """
+    Account = models.db.Account
+    AccountTransaction = models.db.AccountTransaction
+
+    accounts = {
+        account.number: account
+        for account in (
+            await db.execute(
+                select(
+                    Account.number, Account.enabled,
+                    Account.current_amount, Account.min_amount
+                )
+                    .where(Account.number.in_({posting.account_number for posting in postings}))
+            )
+        )\
+            .all()
+    }
+
+    results: List[Optional[PostingResult]] = [None] * len(postings)
+    balances: Dict[str, float] = {}
+    # Total delta and lowest running delta of each account
+    deltas: Dict[str, Tuple[float, float]] = {}
+
+    for index, posting in enumerate(postings):
+        number = posting.account_number
+        account = accounts.get(number)
+
+        if account is None:
+            results[index] = PostingResult(404, "Not found")
+            continue
+
+        if not account.enabled:
+            results[index] = PostingResult(423, "Account disabled")
+            continue
+
+        balance = balances.get(number, account.current_amount or 0.0)
+
+        if posting.amount < 0 and balance + posting.amount < (account.min_amount or 0.0):
+            results[index] = PostingResult(
+                403, "The request operation exeeds the minimum account amount"
+            )
+            continue
+
+        balances[number] = balance + posting.amount
+        delta, lowest = deltas.get(number, (0.0, 0.0))
+        deltas[number] = (delta + posting.amount, min(lowest, delta + posting.amount))
+
+    if atomic and any(results):
+        return [result or NOT_POSTED for result in results]
+
+    current_amount = func.coalesce(Account.current_amount, 0.0)
+    posted: Dict[str, float] = {}
+
+    for number, (delta, lowest) in deltas.items():
+        where = (Account.number == number) & (Account.enabled == True)
+
+        if lowest < 0:
+            # The balances read above may be stale, the lowest point
+            # of the batch is checked against the current amount
+            where &= (current_amount + lowest >= func.coalesce(Account.min_amount, 0.0))
+
+        row = (
+            await db.execute(
+                update(Account)
+                    .where(where)
+                    .values(current_amount=current_amount + delta)
+                    .returning(Account.current_amount)
+                    .execution_options(synchronize_session=False)
+            )
+        )\
+            .first()
+
+        if row is not None:
+            posted[number] = row.current_amount
+            continue
+
+        await balance_cache.delete(number)
+
+        if atomic:
+            await db.rollback()
+
+            return [
+                result or (
+                    CONCURRENT_UPDATE if postings[index].account_number == number
+                    else NOT_POSTED
+                )
+                for index, result in enumerate(results)
+            ]
+
+        for index, posting in enumerate(postings):
+            if results[index] is None and posting.account_number == number:
+                results[index] = CONCURRENT_UPDATE
+
+    pending = [index for index, result in enumerate(results) if result is None]
+
+    if pending:
+        now = the_ts_now()
+        transactions = (
+            await db.execute(
+                insert(AccountTransaction)
+                    .returning(AccountTransaction, sort_by_parameter_order=True),
+                [
+                    dict(
+                        account_number=postings[index].account_number,
+                        user=user_id,
+                        description=postings[index].description,
+                        document=postings[index].document,
+                        amount=postings[index].amount,
+                        date=now
+                    )
+                    for index in pending
+                ]
+            )
+        )\
+            .scalars()\
+            .all()
+
+        for index, transaction in zip(pending, transactions):
+            results[index] = PostingResult(200, transaction=transaction)
+
+    await db.commit()
+
+    for number, amount in posted.items():
+        cached = await balance_cache.peek(number)
+
+        if cached is not None:
+            await balance_cache.set(number, dict(cached, current_amount=amount))
+
+    return results
+
+
+async def _posting_rejected(db: AsyncSession, account_number: str):
+    enabled = (
+        await db.execute(
+            select(models.db.Account.enabled)
+                .where(models.db.Account.number == account_number)
+        )
+    )\
+        .first()
+
+    if enabled is None:
+        raise HTTPException(404)
+
+    if not enabled.enabled:
+        raise HTTPException(423, detail="Account disabled")
+
+    raise HTTPException(403, detail="The request operation exeeds the minimum account amount")
+
+
+async def main():
+    from .sql import get_sessionmaker, dispose
+
+    async with get_sessionmaker()() as db:
+        created = await checkpoint_accounts(db)
+
+    await dispose()
+    print("%d balance checkpoints created" % created)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
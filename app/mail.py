@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Callable, List, Optional, Sequence
+from uuid import uuid4
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from . import models
+from .conf import settings
+from .sql import get_sessionmaker
+from .util import project_root_path, the_ts_now
+from .util.templates import TemplateRegistry
+
+__all__ = ('enqueue', 'smtp_send_batch', 'OutboxWorker', 'outbox_worker', 'mail_templates')
+
+logger = logging.getLogger(__name__)
+
+SendBatch = Callable[[Sequence[models.db.MailOutbox]], List[Optional[str]]]
+
+
+def enqueue(
+    db: AsyncSession, mail_to: str, subject: str,
+    html: str, text: Optional[str] = None
+) -> models.db.MailOutbox:
+    """
+    Adds the mail to the outbox, it is committed along with the caller
+    changes and delivered later by the outbox worker.
+    """
+    mail = models.db.MailOutbox(mail_to=mail_to, subject=subject, html=html, text=text)
+    db.add(mail)
+
+    return mail
+
+
+def smtp_send_batch(mails: Sequence[models.db.MailOutbox]) -> List[Optional[str]]:
+    """
+    Blocking, sends the batch through one SMTP connection and returns
+    the error of each mail or `None` if it was delivered.
+    """
+    import emails
+    from emails.backend.smtp import SMTPBackend
+
+    backend = SMTPBackend(
+        host=settings.mail_smtp_host,
+        port=settings.mail_smtp_port,
+        tls=settings.mail_smtp_tls,
+        user=settings.mail_smtp_user or settings.mail_from,
+        password=settings.mail_pass,
+        timeout=settings.mail_smtp_timeout
+    )
+    errors: List[Optional[str]] = []
+
+    try:
+        for mail in mails:
+            message = emails.Message(
+                text=mail.text,
+                html=mail.html,
+                mail_from=(settings.mail_from_name, settings.mail_from),
+                subject=mail.subject
+            )
+
+            try:
+                response = message.send(to=mail.mail_to, smtp=backend)
+            except Exception as exc:
+                errors.append(repr(exc))
+                continue
+
+            if response.status_code == 250:
+                errors.append(None)
+            else:
+                errors.append("%s: %s" % (response.status_code, response.status_text))
+    finally:
+        backend.close()
+
+    return errors
+
+
+class OutboxWorker:
+    """
+    Delivers the outbox in batches. Mails are claimed with a lease so
+    several workers don't send the same mail, and failed deliveries are
+    retried with exponential backoff until `max_attempts`.
+    """
+
+    def __init__(
+        self,
+        send: SendBatch = smtp_send_batch,
+        batch_size: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        backoff: Optional[float] = None,
+        poll: Optional[float] = None,
+        lease: Optional[int] = None
+    ):
+        self.send = send
+        self.batch_size = batch_size or settings.mail_outbox_batch_size
+        self.max_attempts = max_attempts or settings.mail_outbox_max_attempts
+        self.backoff = backoff or settings.mail_outbox_backoff_seconds
+        self.poll = poll or settings.mail_outbox_poll_seconds
+        self.lease = lease or settings.mail_outbox_lease_seconds
+
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def retry_delay(self, attempts: int) -> float:
+        return self.backoff * (2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+
+    async def claim(self, db: AsyncSession) -> List[models.db.MailOutbox]:
+        MailOutbox = models.db.MailOutbox
+        now = the_ts_now()
+        claim = uuid4().hex
+        due = (
+            (MailOutbox.status == "pending")
+            & (MailOutbox.next_attempt <= now)
+        )
+
+        await db.execute(
+            update(MailOutbox)
+                .where(
+                    due & MailOutbox.id.in_(
+                        select(MailOutbox.id)
+                            .where(due)
+                            .order_by(MailOutbox.next_attempt)
+                            .limit(self.batch_size)
+                            .scalar_subquery()
+                    )
+                )
+                .values(claim=claim, next_attempt=now + self.lease)
+                .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        return (
+            await db.execute(
+                select(MailOutbox).where(MailOutbox.claim == claim)
+            )
+        )\
+            .scalars()\
+            .all()
+
+    async def process_batch(self) -> int:
+        async with get_sessionmaker()() as db:
+            mails = await self.claim(db)
+
+            if not mails:
+                return 0
+
+            errors = await asyncio.get_running_loop().run_in_executor(
+                None, self.send, mails
+            )
+            now = the_ts_now()
+
+            for mail, error in zip(mails, errors):
+                mail.attempts += 1
+                mail.claim = None
+
+                if error is None:
+                    mail.status = "sent"
+                    mail.sent = now
+                    continue
+
+                mail.last_error = error[:1000]
+
+                if mail.attempts >= self.max_attempts:
+                    mail.status = "failed"
+                    logger.error("Mail %s failed after %d attempts: %s", mail.id, mail.attempts, error)
+                else:
+                    mail.next_attempt = now + int(self.retry_delay(mail.attempts))
+
+            await db.commit()
+
+        return len(mails)
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self):
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+
+            try:
+                processed = await self.process_batch()
+            except Exception:
+                logger.exception("Mail outbox batch failed")
+                processed = 0
+
+            if processed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def start(self):
+        if self._task is None:
+            # Created here so they belong to the running loop
+            self._stopping = asyncio.Event()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+
+outbox_worker = OutboxWorker()
+mail_templates = TemplateRegistry(
+    os.path.join(project_root_path(), 'templates', 'mail'),
+    hot_reload=settings.mail_templates_hot_reload
+)
@@ -0,0 +1,471 @@
+import asyncio
+import bisect
+import fcntl
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import orjson
+
+from .conf import settings
+
+__all__ = (
+    'CONTENT_TYPE', 'DEFAULT_BUCKETS', 'MetricsRegistry', 'MetricsMiddleware',
+    'family', 'sample', 'pool_collector', 'cache_collector', 'limiter_collector',
+    'registry'
+)
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Counters and histograms of the processes that are gone
+DEAD_SNAPSHOT = 'metrics-dead.json'
+
+Family = Dict[str, Any]
+Collector = Callable[[], Iterable[Family]]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def sample(name: str, **labels) -> str:
+    """
+    Sample name with its labels, as written in the text format.
+    """
+    if not labels:
+        return name
+
+    return '%s{%s}' % (
+        name, ','.join('%s="%s"' % (label, _escape(value)) for label, value in labels.items())
+    )
+
+
+def family(
+    name: str, kind: str, help: str, samples: Dict[str, float], merge: str = 'sum'
+) -> Family:
+    """
+    Metric family, `merge` is how the samples of several processes
+    are aggregated: `sum` or `max`.
+    """
+    return dict(name=name, type=kind, help=help, samples=samples, merge=merge)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _read(path: str) -> Optional[List[Family]]:
+    try:
+        with open(path, 'rb') as snapshot:
+            return orjson.loads(snapshot.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+
+def _write(path: str, families: List[Family]):
+    with open(path + '.tmp', 'wb') as snapshot:
+        snapshot.write(orjson.dumps(families))
+
+    os.replace(path + '.tmp', path)
+
+
+def _merge(merged: Dict[str, Family], families: Iterable[Family]):
+    """
+    Merges `families` into `merged` by name, so collectors and
+    processes can report samples of the same family.
+    """
+    for metric in families:
+        target = merged.setdefault(metric['name'], dict(metric, samples={}))
+        samples = target['samples']
+
+        for key, value in metric['samples'].items():
+            if key not in samples:
+                samples[key] = value
+            elif metric['merge'] == 'max':
+                samples[key] = max(samples[key], value)
+            else:
+                samples[key] += value
+
+    return merged
+
+
+class MetricsRegistry:
+    """
+    Per-process request metrics and collectors of other stats. With a
+    `multiprocess_dir` every process writes its snapshot there and the
+    exposition aggregates the snapshots of all the processes.
+    """
+
+    def __init__(
+        self, buckets: Sequence[float] = DEFAULT_BUCKETS,
+        multiprocess_dir: Optional[str] = None, flush_interval: float = 5.0
+    ):
+        self.buckets = tuple(buckets)
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        # (method, route, status) -> [count, sum, bucket counts..., +Inf count]
+        self.requests: Dict[Tuple[str, str, int], List[float]] = {}
+        self.active: Dict[int, Dict[str, Any]] = {}
+        self.collectors: List[Collector] = []
+
+        self._routes: Dict[Any, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register_collector(self, collector: Collector):
+        self.collectors.append(collector)
+
+    def route(self, scope: Dict[str, Any]) -> str:
+        """
+        Path template of the endpoint the router matched, so the path
+        parameters don't blow up the label cardinality.
+        """
+        endpoint = scope.get('endpoint')
+
+        if endpoint is None:
+            return 'unmatched'
+
+        path = self._routes.get(endpoint)
+
+        if path is None:
+            self._routes = {
+                route.endpoint: route.path
+                for route in getattr(scope.get('app'), 'routes', ())
+                if hasattr(route, 'endpoint')
+            }
+            path = self._routes.setdefault(endpoint, 'unmatched')
+
+        return path
+
+    def observe(self, method: str, route: str, status: int, elapsed: float):
+        key = (method, route, status)
+        series = self.requests.get(key)
+
+        if series is None:
+            series = self.requests[key] = [0, 0.0] + [0] * (len(self.buckets) + 1)
+
+        series[0] += 1
+        series[1] += elapsed
+        series[2 + bisect.bisect_left(self.buckets, elapsed)] += 1
+
+    def collect(self) -> List[Family]:
+        requests: Dict[str, float] = {}
+        durations: Dict[str, float] = {}
+        in_flight: Dict[str, float] = {}
+
+        for (method, route, status), series in list(self.requests.items()):
+            labels = dict(method=method, route=route, status=status)
+            requests[sample('http_requests_total', **labels)] = series[0]
+            cumulative = 0
+
+            for le, count in zip(self.buckets + ('+Inf',), series[2:]):
+                cumulative += count
+                durations[sample('http_request_duration_seconds_bucket', **labels, le=le)] = cumulative
+
+            durations[sample('http_request_duration_seconds_sum', **labels)] = series[1]
+            durations[sample('http_request_duration_seconds_count', **labels)] = series[0]
+
+        for scope in list(self.active.values()):
+            key = sample('http_requests_in_flight', method=scope['method'], route=self.route(scope))
+            in_flight[key] = in_flight.get(key, 0) + 1
+
+        families = [
+            family('http_requests_total', 'counter', "HTTP requests.", requests),
+            family('http_request_duration_seconds', 'histogram', "HTTP request latency.", durations),
+            family('http_requests_in_flight', 'gauge', "HTTP requests being served.", in_flight),
+        ]
+
+        for collector in self.collectors:
+            try:
+                families.extend(collector())
+            except Exception:
+                logger.exception("Metrics collector %r failed", collector)
+
+        return families
+
+    def _snapshot_path(self, pid: int) -> str:
+        return os.path.join(self.multiprocess_dir, 'metrics-%d.json' % pid)
+
+    def write_snapshot(self):
+        _write(self._snapshot_path(os.getpid()), self.collect())
+
+    @contextmanager
+    def _locked(self):
+        """
+        Serializes the processes folding and reading the snapshots.
+        """
+        with open(os.path.join(self.multiprocess_dir, 'metrics.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _fold(self, path: str):
+        """
+        Adds the counters and histograms of the snapshot at `path` to
+        the dead snapshot and removes it, its gauges are dropped. Must be
+        called holding the lock.
+        """
+        families = _read(path)
+
+        if families:
+            dead_path = os.path.join(self.multiprocess_dir, DEAD_SNAPSHOT)
+            dead = _merge({}, _read(dead_path) or ())
+            _merge(dead, (
+                metric for metric in families if metric['type'] in ('counter', 'histogram')
+            ))
+            _write(dead_path, list(dead.values()))
+
+        _remove(path)
+
+    def read_snapshots(self) -> List[Family]:
+        """
+        Snapshots of the live processes merged with the dead snapshot.
+        Snapshots of processes that are gone are folded into the dead one
+        first, so the counters never go down.
+        """
+        merged: Dict[str, Family] = {}
+
+        with self._locked():
+            names = sorted(
+                name for name in os.listdir(self.multiprocess_dir)
+                if name.startswith('metrics-') and name.endswith('.json')
+            )
+
+            for name in names:
+                pid = name[len('metrics-'):-len('.json')]
+
+                if pid.isdigit() and not _pid_alive(int(pid)):
+                    self._fold(os.path.join(self.multiprocess_dir, name))
+
+            for name in sorted(os.listdir(self.multiprocess_dir)):
+                if name.startswith('metrics-') and name.endswith('.json'):
+                    _merge(merged, _read(os.path.join(self.multiprocess_dir, name)) or ())
+
+        return list(merged.values())
+
+    def exposition(self) -> str:
+        """
+        Prometheus text format of this process, or of all of them in
+        multiprocess mode.
+        """
+        if self.multiprocess_dir:
+            self.write_snapshot()
+            families = self.read_snapshots()
+        else:
+            families = list(_merge({}, self.collect()).values())
+
+        lines = []
+
+        for metric in families:
+            lines.append('# HELP %s %s' % (metric['name'], metric['help']))
+            lines.append('# TYPE %s %s' % (metric['name'], metric['type']))
+            lines.extend('%s %s' % item for item in metric['samples'].items())
+
+        return '\n'.join(lines) + '\n'
+
+    async def _flush(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+
+            try:
+                self.write_snapshot()
+            except OSError:
+                logger.exception("Metrics snapshot failed")
+
+    async def start(self):
+        if self.multiprocess_dir and self._task is None:
+            os.makedirs(self.multiprocess_dir, exist_ok=True)
+
+            # Left by a process that had the same pid
+            with self._locked():
+                self._fold(self._snapshot_path(os.getpid()))
+
+            self._task = asyncio.create_task(self._flush())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+            try:
+                self.write_snapshot()
+
+                with self._locked():
+                    self._fold(self._snapshot_path(os.getpid()))
+            except OSError:
+                logger.exception("Metrics snapshot failed")
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording count, latency and in-flight
+    requests by method, route template and status.
+    """
+
+    def __init__(self, app, registry: Optional[MetricsRegistry] = None):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        metrics = self.registry or registry
+        status = [500]
+
+        async def send_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+
+            await send(message)
+
+        key = id(scope)
+        metrics.active[key] = scope
+        started = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            metrics.active.pop(key, None)
+            metrics.observe(
+                scope['method'], metrics.route(scope), status[0],
+                time.perf_counter() - started
+            )
+
+
+def pool_collector() -> List[Family]:
+    from .sql import pool_stats, replica_stats
+
+    stats = pool_stats()
+    replicas = replica_stats()
+    families = [
+        family(
+            'db_replica_healthy', 'gauge', "Replica in the read rotation.",
+            {sample('db_replica_healthy', replica=replica['replica']): int(replica['healthy']) for replica in replicas}
+        ),
+        family(
+            'db_replica_ejections_total', 'counter', "Replica ejections after errors.",
+            {sample('db_replica_ejections_total', replica=replica['replica']): replica['ejections'] for replica in replicas}
+        ),
+    ] if replicas else []
+
+    if 'wait_count' not in stats:
+        return families
+
+    return families + [
+        family('db_pool_size', 'gauge', "Connections kept in the pool.", {'db_pool_size': stats['size']}),
+        family('db_pool_checked_out', 'gauge', "Connections in use.", {'db_pool_checked_out': stats['checked_out']}),
+        family('db_pool_overflow', 'gauge', "Connections over the pool size.", {'db_pool_overflow': max(stats['overflow'], 0)}),
+        family('db_pool_waits_total', 'counter', "Connection checkouts.", {'db_pool_waits_total': stats['wait_count']}),
+        family(
+            'db_pool_wait_seconds_total', 'counter', "Time waiting for a connection.",
+            {'db_pool_wait_seconds_total': stats['wait_seconds_total']}
+        ),
+        family(
+            'db_pool_wait_seconds_max', 'gauge', "Longest wait for a connection.",
+            {'db_pool_wait_seconds_max': stats['wait_seconds_max']}, merge='max'
+        ),
+        family(
+            'db_pool_wait_timeouts_total', 'counter', "Checkouts that timed out.",
+            {'db_pool_wait_timeouts_total': stats['wait_timeouts']}
+        ),
+    ]
+
+
+def cache_collector(name: str, cache) -> Collector:
+    def collect() -> List[Family]:
+        stats = cache.stats()
+        families = [
+            family(
+                'cache_%s_total' % stat, 'counter', "Cache %s." % stat,
+                {sample('cache_%s_total' % stat, cache=name): stats[stat]}
+            )
+            for stat in ('hits', 'misses', 'evictions')
+            if stat in stats
+        ]
+
+        if 'size' in stats:
+            families.append(family(
+                'cache_entries', 'gauge', "Cached entries.",
+                {sample('cache_entries', cache=name): stats['size']}
+            ))
+
+        return families
+
+    return collect
+
+
+def limiter_collector(name: str, limiter) -> Collector:
+    def collect() -> List[Family]:
+        stats = limiter.stats()
+
+        return [
+            family(
+                'ratelimit_cache_hits_total', 'counter', "Rate limit windows served from memory.",
+                {sample('ratelimit_cache_hits_total', limiter=name): stats['hits']}
+            ),
+            family(
+                'ratelimit_cache_misses_total', 'counter', "Rate limit windows loaded.",
+                {sample('ratelimit_cache_misses_total', limiter=name): stats['misses']}
+            ),
+            family(
+                'ratelimit_rejected_total', 'counter', "Requests over the limit.",
+                {sample('ratelimit_rejected_total', limiter=name): stats['rejected']}
+            ),
+            family(
+                'ratelimit_keys', 'gauge', "Rate limit windows in memory.",
+                {sample('ratelimit_keys', limiter=name): stats['size']}
+            ),
+        ]
+
+    return collect
+
+
+def revocation_collector() -> List[Family]:
+    from .revocation import revocation_list
+
+    stats = revocation_list.stats()
+
+    return [
+        family(
+            'jwt_denylist_checks_total', 'counter', "Revocation checks by outcome.",
+            {
+                sample('jwt_denylist_checks_total', result='filter_negative'): stats['negatives'],
+                sample('jwt_denylist_checks_total', result='lookup'): stats['lookups'],
+                sample('jwt_denylist_checks_total', result='false_positive'): stats['false_positives'],
+            }
+        ),
+        family(
+            'jwt_denylist_tokens', 'gauge', "Revoked tokens in the filters.",
+            {sample('jwt_denylist_tokens'): stats['tokens']}
+        ),
+        family(
+            'jwt_denylist_filter_bytes', 'gauge', "Memory of the filters.",
+            {sample('jwt_denylist_filter_bytes'): stats['bytes']}
+        ),
+    ]
+
+
+registry = MetricsRegistry(
+    multiprocess_dir=settings.metrics_multiprocess_dir or None,
+    flush_interval=settings.metrics_flush_seconds
+)
@@ -1,7 +1,153 @@
-from starlette.middleware.cors import CORSMiddleware
+from typing import Iterable, List, Optional, Tuple
 
+Header = Tuple[bytes, bytes]
 
-class CORSOnAllMiddleware(CORSMiddleware):
-    async def __call__(self, scope, receive, send) -> None:
-        scope['headers'].append((b'origin', b'allow'))
-        return await super().__call__(scope, receive, send)
+SAFELISTED_HEADERS = frozenset((b'accept', b'accept-language', b'content-language', b'content-type'))
+ALL_METHODS = (b'DELETE', b'GET', b'HEAD', b'OPTIONS', b'PATCH', b'POST', b'PUT')
+
+
+class CORSMiddleware:
+    """
+    Pure ASGI CORS middleware. Response headers are built once here, requests
+    without an `Origin` or coming from the same origin pass through untouched
+    and preflights are answered with `Access-Control-Max-Age` so browsers
+    cache them.
+    """
+
+    def __init__(
+        self,
+        app,
+        allow_origins: Iterable[str] = (),
+        allow_methods: Iterable[str] = ('GET',),
+        allow_headers: Iterable[str] = (),
+        allow_credentials: bool = False,
+        expose_headers: Iterable[str] = (),
+        max_age: int = 600
+    ):
+        allow_origins = [origin.encode('latin-1') for origin in allow_origins]
+        allow_methods = [method.upper().encode('latin-1') for method in allow_methods]
+        allow_headers = [header.lower().encode('latin-1') for header in allow_headers]
+
+        self.app = app
+        self.allow_all_origins = b'*' in allow_origins
+        self.allow_all_headers = b'*' in allow_headers
+        self.allow_origins = frozenset(allow_origins)
+        self.allow_methods = frozenset(ALL_METHODS if b'*' in allow_methods else allow_methods)
+        self.allow_headers = SAFELISTED_HEADERS.union(allow_headers)
+        # With credentials browsers reject a wildcard, the origin is echoed back
+        self.echo_origin = not self.allow_all_origins or allow_credentials
+
+        common: List[Header] = []
+
+        if allow_credentials:
+            common.append((b'access-control-allow-credentials', b'true'))
+
+        if self.echo_origin:
+            common.append((b'vary', b'origin'))
+        else:
+            common.append((b'access-control-allow-origin', b'*'))
+
+        self.simple_headers = list(common)
+
+        if expose_headers:
+            self.simple_headers.append(
+                (b'access-control-expose-headers', ', '.join(expose_headers).encode('latin-1'))
+            )
+
+        self.preflight_headers = common + [
+            (b'access-control-allow-methods', b', '.join(sorted(self.allow_methods))),
+            (b'access-control-max-age', str(max_age).encode('latin-1')),
+        ]
+
+        if not self.allow_all_headers:
+            self.preflight_headers.append(
+                (b'access-control-allow-headers', b', '.join(sorted(self.allow_headers)))
+            )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        origin = host = None
+
+        for name, value in scope['headers']:
+            if name == b'origin':
+                origin = value
+            elif name == b'host':
+                host = value
+
+        if origin is None or (host is not None and self.same_origin(scope, origin, host)):
+            return await self.app(scope, receive, send)
+
+        if scope['method'] == 'OPTIONS':
+            request_method = request_headers = None
+
+            for name, value in scope['headers']:
+                if name == b'access-control-request-method':
+                    request_method = value
+                elif name == b'access-control-request-headers':
+                    request_headers = value
+
+            if request_method is not None:
+                return await self.preflight(origin, request_method, request_headers, send)
+
+        if not self.allow_all_origins and origin not in self.allow_origins:
+            return await self.app(scope, receive, send)
+
+        headers = self.simple_headers
+
+        if self.echo_origin:
+            headers = headers + [(b'access-control-allow-origin', origin)]
+
+        async def send_cors(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', ()), *headers]
+
+            await send(message)
+
+        await self.app(scope, receive, send_cors)
+
+    @staticmethod
+    def same_origin(scope, origin: bytes, host: bytes) -> bool:
+        scheme = scope.get('scheme', 'http')
+
+        return (
+            len(origin) == len(scheme) + 3 + len(host)
+            and origin.endswith(host)
+            and origin.startswith(scheme.encode('latin-1'))
+            and origin[len(scheme):len(scheme) + 3] == b'://'
+        )
+
+    async def preflight(self, origin: bytes, method: bytes, request_headers: Optional[bytes], send):
+        allowed = (
+            (self.allow_all_origins or origin in self.allow_origins)
+            and method in self.allow_methods
+            and (
+                self.allow_all_headers
+                or request_headers is None
+                or all(
+                    header.strip().lower() in self.allow_headers
+                    for header in request_headers.split(b',') if header.strip()
+                )
+            )
+        )
+
+        if not allowed:
+            await send({
+                'type': 'http.response.start',
+                'status': 400,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8'), (b'content-length', b'24')]
+            })
+            await send({'type': 'http.response.body', 'body': b'Disallowed CORS request\n'})
+            return
+
+        headers = self.preflight_headers + [(b'content-length', b'0')]
+
+        if self.echo_origin:
+            headers.append((b'access-control-allow-origin', origin))
+
+        if self.allow_all_headers and request_headers:
+            headers.append((b'access-control-allow-headers', request_headers))
+
+        await send({'type': 'http.response.start', 'status': 204, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,25 @@
+"""Users password
+
+Revision ID: 3a9c7d2e5b14
+Revises: 8e2d4b6a1f07
+Create Date: 2026-10-18 11:27:05.302671
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '3a9c7d2e5b14'
+down_revision = '8e2d4b6a1f07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('password', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('users', 'password')
@@ -0,0 +1,31 @@
+"""Accounts transactions date index
+
+Revision ID: 5c1f0e7a9b3d
+Revises: 21576eccbf20
+Create Date: 2026-10-18 09:12:40.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1f0e7a9b3d'
+down_revision = '21576eccbf20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'idx_accounts_transactions_account_date', 'accounts_transactions',
+        ['account_number', 'date', 'id', 'amount'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'idx_accounts_transactions_account_date',
+        table_name='accounts_transactions'
+    )
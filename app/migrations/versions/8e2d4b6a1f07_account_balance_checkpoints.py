@@ -0,0 +1,42 @@
+"""Account balance checkpoints
+
+Revision ID: 8e2d4b6a1f07
+Revises: 5c1f0e7a9b3d
+Create Date: 2026-10-18 10:03:21.544917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2d4b6a1f07'
+down_revision = '5c1f0e7a9b3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('account_balance_checkpoints',
+    sa.Column('id', sa.Integer(), nullable=True),
+    sa.Column('account_number', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('up_to_tx_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Integer(), nullable=False),
+    sa.Column('balance', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['account_number'], ['accounts.number'], ),
+    sa.ForeignKeyConstraint(['up_to_tx_id'], ['accounts_transactions.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'idx_account_balance_checkpoints_account_date', 'account_balance_checkpoints',
+        ['account_number', 'date', 'up_to_tx_id'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'idx_account_balance_checkpoints_account_date',
+        table_name='account_balance_checkpoints'
+    )
+    op.drop_table('account_balance_checkpoints')
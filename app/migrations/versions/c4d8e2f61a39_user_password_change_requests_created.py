@@ -0,0 +1,36 @@
+"""User password change requests created
+
+Revision ID: c4d8e2f61a39
+Revises: b7e41c0d9a62
+Create Date: 2026-10-18 14:05:52.910284
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8e2f61a39'
+down_revision = 'b7e41c0d9a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'user_password_change_requests',
+        sa.Column('created', sa.Integer(), nullable=False, server_default='0')
+    )
+    op.create_index(
+        'idx_user_password_change_requests_user_created', 'user_password_change_requests',
+        ['user_id', 'created'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'idx_user_password_change_requests_user_created',
+        table_name='user_password_change_requests'
+    )
+    op.drop_column('user_password_change_requests', 'created')
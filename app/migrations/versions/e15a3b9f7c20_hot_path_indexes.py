@@ -0,0 +1,46 @@
+"""Hot path indexes
+
+Revision ID: e15a3b9f7c20
+Revises: c4d8e2f61a39
+Create Date: 2026-10-18 15:21:17.486003
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'e15a3b9f7c20'
+down_revision = 'c4d8e2f61a39'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'idx_user_accounts_user_account', 'user_accounts',
+        ['user_id', 'account_number'], unique=False
+    )
+    op.create_index(
+        'idx_users_names', 'users',
+        ['first_surname', 'last_surname', 'first_company_name', 'following_names', 'id'],
+        unique=False,
+        postgresql_ops={
+            'first_surname': 'NULLS FIRST',
+            'last_surname': 'NULLS FIRST',
+            'following_names': 'NULLS FIRST'
+        }
+    )
+    op.create_index(
+        'idx_accounts_name', 'accounts',
+        ['name', 'number'], unique=False
+    )
+    op.create_index('idx_mail_outbox_claim', 'mail_outbox', ['claim'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_mail_outbox_claim', table_name='mail_outbox')
+    op.drop_index('idx_accounts_name', table_name='accounts')
+    op.drop_index('idx_users_names', table_name='users')
+    op.drop_index('idx_user_accounts_user_account', table_name='user_accounts')
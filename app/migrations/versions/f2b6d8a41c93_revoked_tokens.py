@@ -0,0 +1,34 @@
+"""Revoked tokens
+
+Revision ID: f2b6d8a41c93
+Revises: e15a3b9f7c20
+Create Date: 2026-10-18 16:04:52.118327
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b6d8a41c93'
+down_revision = 'e15a3b9f7c20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('revoked_tokens',
+    sa.Column('jti', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('expires', sa.Integer(), nullable=False),
+    sa.Column('revoked', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('jti')
+    )
+    op.create_index('idx_revoked_tokens_revoked', 'revoked_tokens', ['revoked'], unique=False)
+    op.create_index('idx_revoked_tokens_expires', 'revoked_tokens', ['expires'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_revoked_tokens_expires', table_name='revoked_tokens')
+    op.drop_index('idx_revoked_tokens_revoked', table_name='revoked_tokens')
+    op.drop_table('revoked_tokens')
@@ -3,7 +3,12 @@ from .account import Account
 from .account_transaction import (
     AccountTransaction, TransactionDetail, AccountBalanceTransaction
 )
-from .auth import JWTToken, Login
+from .auth import JWTToken, Login, Logout
+from .batch import BatchGetRequest, BatchGetItem, BatchGetResponse
+from .bulk_posting import (
+    BulkPosting, BulkPostingRequest, BulkPostingResult, BulkPostingResponse
+)
+from .cursor_page import CursorPage
 from .user import User, PartialUser
 from .user_password_change import (
     UserPasswordChange, UserPasswordChangeInput, UserPasswordChangeRequest
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -11,3 +13,7 @@ class JWTToken(BaseModel):
     access_token_expires: int = Field(title="JWT access token expires timestamp (milis)")
     refresh_token: str = Field(title="JWT refresh token")
     refresh_token_expires: int = Field(title="JWT refresh token expires timestamp (milis)")
+
+
+class Logout(BaseModel):
+    refresh_token: Optional[str] = Field(title="JWT refresh token to revoke as well")
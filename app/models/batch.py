@@ -0,0 +1,25 @@
+from typing import Generic, List, Optional, TypeVar
+
+from pydantic import BaseModel, Field
+from pydantic.generics import GenericModel
+
+from ..conf import settings
+
+T = TypeVar("T")
+
+
+class BatchGetRequest(BaseModel):
+    keys: List[str] = Field(
+        title="Keys", min_items=1, max_items=settings.batch_get_max_keys
+    )
+
+
+class BatchGetItem(GenericModel, Generic[T]):
+    key: str = Field(title="Key")
+    status: int = Field(title="HTTP status of the key")
+    detail: Optional[str] = Field(title="Error detail")
+    data: Optional[T] = Field(title="Data")
+
+
+class BatchGetResponse(GenericModel, Generic[T]):
+    items: List[BatchGetItem[T]] = Field(title="Items, in the requested order")
@@ -0,0 +1,38 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from .account_transaction import AccountTransaction
+from ..conf import settings
+
+
+class BulkPosting(BaseModel):
+    account_number: str = Field(title="Account number")
+    operation: str = Field(title="Operation", regex="^(deposit|withdraw)$")
+    amount: float = Field(title="Amount", gt=0)
+    note: str = Field(title="Transaction note")
+    document: Optional[str] = Field(title="Document associated to transaction")
+
+
+class BulkPostingRequest(BaseModel):
+    mode: str = Field(
+        "all_or_nothing", title="Mode", regex="^(all_or_nothing|best_effort)$",
+        description="`all_or_nothing` posts nothing if a posting is rejected, "
+                    "`best_effort` posts all but the rejected postings"
+    )
+    postings: List[BulkPosting] = Field(
+        title="Postings, applied in order",
+        min_items=1, max_items=settings.bulk_posting_max_items
+    )
+
+
+class BulkPostingResult(BaseModel):
+    index: int = Field(title="Index of the posting")
+    status: int = Field(title="HTTP status of the posting")
+    detail: Optional[str] = Field(title="Error detail")
+    transaction: Optional[AccountTransaction] = Field(title="Posted transaction")
+
+
+class BulkPostingResponse(BaseModel):
+    posted: int = Field(title="Posted transactions")
+    items: List[BulkPostingResult] = Field(title="Results, in the requested order")
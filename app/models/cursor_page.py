@@ -0,0 +1,14 @@
+from typing import Generic, Optional, Sequence, TypeVar
+
+from pydantic import Field
+from pydantic.generics import GenericModel
+
+T = TypeVar("T")
+
+
+class CursorPage(GenericModel, Generic[T]):
+    items: Sequence[T] = Field(title="Items")
+    size: int = Field(title="Page size")
+    total: Optional[int] = Field(title="Estimated total items")
+    cursor: Optional[str] = Field(title="Cursor of the next page")
+    next: Optional[str] = Field(title="Next page URL")
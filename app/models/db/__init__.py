@@ -1,4 +1,7 @@
 from .user import User, UserAccounts
 from .account import Account
+from .account_balance_checkpoint import AccountBalanceCheckpoint
 from .account_transaction import AccountTransaction
+from .mail_outbox import MailOutbox
 from .user_password_change import UserPasswordChange
+from .revoked_token import RevokedToken
@@ -1,3 +1,4 @@
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 from .. import account
@@ -8,3 +9,6 @@ class Account(account.Account, SQLModel, table=True):
     manager_user: int = Field(title="Manager user", default=None, foreign_key="users.id")
 
     __tablename__: str = "accounts"
+    __table_args__ = (
+        Index("idx_accounts_name", "name", "number"),
+    )
@@ -0,0 +1,22 @@
+from typing import Optional
+
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field
+
+
+class AccountBalanceCheckpoint(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    account_number: str = Field(title="Account number", foreign_key="accounts.number")
+    up_to_tx_id: int = Field(
+        title="Last transaction included", foreign_key="accounts_transactions.id"
+    )
+    date: int = Field(title="Timestamp of the last transaction included")
+    balance: float = Field(title="Account amount after the last transaction included")
+
+    __tablename__: str = "account_balance_checkpoints"
+    __table_args__ = (
+        Index(
+            "idx_account_balance_checkpoints_account_date",
+            "account_number", "date", "up_to_tx_id"
+        ),
+    )
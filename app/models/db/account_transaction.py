@@ -1,5 +1,6 @@
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 from .. import account_transaction
@@ -8,6 +9,12 @@ from ...util import the_ts_now
 
 class AccountTransaction(account_transaction.AccountTransaction, SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    date: int = Field(title="Timestamp", default=the_ts_now)
+    date: int = Field(title="Timestamp", default_factory=the_ts_now)
 
     __tablename__: str = "accounts_transactions"
+    __table_args__ = (
+        Index(
+            "idx_accounts_transactions_account_date",
+            "account_number", "date", "id", "amount"
+        ),
+    )
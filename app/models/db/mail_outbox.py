@@ -0,0 +1,27 @@
+from typing import Optional
+
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field
+
+from ...util import the_ts_now
+
+
+class MailOutbox(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    created: int = Field(title="Timestamp", default_factory=the_ts_now)
+    mail_to: str = Field(title="Recipient")
+    subject: str = Field(title="Subject")
+    html: str = Field(title="HTML body")
+    text: Optional[str] = Field(title="Text body")
+    status: str = Field(title="Delivery status", default="pending")
+    attempts: int = Field(title="Delivery attempts", default=0)
+    next_attempt: int = Field(title="Next attempt timestamp", default_factory=the_ts_now)
+    claim: Optional[str] = Field(title="Claim of the worker sending it")
+    last_error: Optional[str] = Field(title="Last delivery error")
+    sent: Optional[int] = Field(title="Delivery timestamp")
+
+    __tablename__: str = "mail_outbox"
+    __table_args__ = (
+        Index("idx_mail_outbox_status_next_attempt", "status", "next_attempt"),
+        Index("idx_mail_outbox_claim", "claim"),
+    )
@@ -0,0 +1,16 @@
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field
+
+from ...util import the_ts_now
+
+
+class RevokedToken(SQLModel, table=True):
+    jti: str = Field(title="Token ID", primary_key=True)
+    expires: int = Field(title="Token expiration timestamp")
+    revoked: int = Field(title="Revocation timestamp", default_factory=the_ts_now)
+
+    __tablename__: str = "revoked_tokens"
+    __table_args__ = (
+        Index("idx_revoked_tokens_revoked", "revoked"),
+        Index("idx_revoked_tokens_expires", "expires"),
+    )
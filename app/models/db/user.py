@@ -1,6 +1,6 @@
 from typing import Optional, List
 
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint
 from sqlmodel import SQLModel, Field, Relationship
 
 from .. import user
@@ -8,12 +8,23 @@ from .. import user
 
 class User(user.User, SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    heroes: List["UserPasswordChange"] = Relationship(back_populates="users")
+    password: Optional[str] = Field(default=None, title="Password hash")
+    password_change_requests: List["UserPasswordChange"] = Relationship(back_populates="user")
 
     __tablename__: str = "users"
     __table_args__ = (
         UniqueConstraint("country_commercial_id", name="unq_user_country_commercial_id"),
         UniqueConstraint("country_personal_id", name="unq_user_country_personal_id"),
+        Index(
+            "idx_users_names",
+            "first_surname", "last_surname", "first_company_name", "following_names", "id",
+            # Appended to the columns, in the order of `keyset_order`
+            postgresql_ops={
+                "first_surname": "NULLS FIRST",
+                "last_surname": "NULLS FIRST",
+                "following_names": "NULLS FIRST"
+            }
+        ),
     )
 
 
@@ -23,3 +34,6 @@ class UserAccounts(SQLModel, table=True):
     account_number: str = Field(default=None, foreign_key="accounts.number")
 
     __tablename__: str = "user_accounts"
+    __table_args__ = (
+        Index("idx_user_accounts_user_account", "user_id", "account_number"),
+    )
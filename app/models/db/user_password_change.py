@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import Optional
 
 from pydantic import validator
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 
 from .. import user_password_change
@@ -14,6 +15,7 @@ class UserPasswordChange(user_password_change.UserPasswordChange, SQLModel, tabl
     user_id: Optional[int] = Field(default=None, foreign_key="users.id")
     user: Optional[User] = Relationship(back_populates="password_change_requests")
     burned: bool = Field(title="Is burned", default=False)
+    created: int = Field(title="Timestamp", default_factory=util.the_ts_now)
 
     @validator("id", pre=True, always=True)
     def set_id(cls, v, values, **kwargs) -> str:
@@ -30,3 +32,6 @@ class UserPasswordChange(user_password_change.UserPasswordChange, SQLModel, tabl
         return util.password_change_request_expiracy()
 
     __tablename__ = "user_password_change_requests"
+    __table_args__ = (
+        Index("idx_user_password_change_requests_user_created", "user_id", "created"),
+    )
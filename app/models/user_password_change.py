@@ -16,5 +16,5 @@ class UserPasswordChangeInput(abstract.PasswordInputModel):
 
 
 class UserPasswordChangeRequest(BaseModel):
-    email: str = Field(title="Recover key")
+    country_commercial_id: str = Field(title="Commercial ID")
 
@@ -0,0 +1,119 @@
+"""
+OpenAPI document serialized once and served as bytes.
+
+The build step writes it, along with its gzip, where `openapi_path`
+points, so a cold process serves it without generating the schema:
+
+    python -m app.openapi [--output path]
+"""
+import argparse
+import gzip
+import os
+from typing import Optional, Tuple
+
+import orjson
+from fastapi import FastAPI, Request
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
+from fastapi.responses import Response
+
+from .conf import settings
+
+__all__ = ('OpenAPIDocument', 'setup')
+
+
+class OpenAPIDocument:
+    def __init__(self, app: FastAPI, path: Optional[str] = None):
+        self.app = app
+        self.path = path
+        self._body: Optional[bytes] = None
+        self._compressed: Optional[bytes] = None
+
+    def build(self) -> bytes:
+        return orjson.dumps(self.app.openapi())
+
+    def write(self, path: str):
+        body = self.build()
+
+        with open(path, 'wb') as output:
+            output.write(body)
+
+        with open(path + '.gz', 'wb') as output:
+            output.write(gzip.compress(body, 9, mtime=0))
+
+    def load(self) -> Tuple[bytes, Optional[bytes]]:
+        """
+        The prebuilt document when there is one, otherwise built on the
+        first call. Either way it is kept in memory.
+        """
+        if self._body is None:
+            if self.path and os.path.exists(self.path):
+                with open(self.path, 'rb') as document:
+                    self._body = document.read()
+
+                if os.path.exists(self.path + '.gz'):
+                    with open(self.path + '.gz', 'rb') as document:
+                        self._compressed = document.read()
+            else:
+                self._body = self.build()
+
+        return self._body, self._compressed
+
+    def compressed(self) -> bytes:
+        body, compressed = self.load()
+
+        if compressed is None:
+            compressed = self._compressed = gzip.compress(body, 6, mtime=0)
+
+        return compressed
+
+    async def response(self, request: Request) -> Response:
+        headers = {'Vary': 'Accept-Encoding'}
+
+        if 'gzip' in request.headers.get('accept-encoding', ''):
+            return Response(
+                self.compressed(), media_type='application/json',
+                headers=dict(headers, **{'Content-Encoding': 'gzip'})
+            )
+
+        return Response(self.load()[0], media_type='application/json', headers=headers)
+
+
+def setup(app: FastAPI, openapi_url: str, docs_url: str, redoc_url: str) -> OpenAPIDocument:
+    """
+    Routes of the document and of the docs UIs, the app must be created
+    with `openapi_url=None` so FastAPI doesn't add its own.
+    """
+    document = OpenAPIDocument(app, settings.openapi_path or None)
+
+    app.add_route(openapi_url, document.response, include_in_schema=False)
+    app.add_route(
+        docs_url,
+        lambda request: get_swagger_ui_html(
+            openapi_url=openapi_url, title="%s - Swagger UI" % app.title
+        ),
+        include_in_schema=False
+    )
+    app.add_route(
+        redoc_url,
+        lambda request: get_redoc_html(
+            openapi_url=openapi_url, title="%s - ReDoc" % app.title
+        ),
+        include_in_schema=False
+    )
+
+    return document
+
+
+def main():
+    from . import app, openapi_document
+
+    parser = argparse.ArgumentParser(description="Builds the OpenAPI document")
+    parser.add_argument("--output", default=settings.openapi_path or None, required=not settings.openapi_path)
+    args = parser.parse_args()
+
+    openapi_document.write(args.output)
+    print("OpenAPI document of %s written to %s" % (app.title, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import bisect
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Sequence, Tuple
+
+__all__ = ('SlidingWindowLimiter',)
+
+Loader = Callable[[float], Awaitable[Sequence[float]]]
+
+
+class SlidingWindowLimiter:
+    """
+    At most `limit` hits per key in the last `window` seconds.
+
+    Each key keeps the timestamps of its hits inside the window, so a
+    check is O(1) amortized. On a cache miss the timestamps are loaded
+    from the source of truth with `load(since)`, and cached windows are
+    reloaded after `ttl` seconds to pick up hits from other processes.
+
+    When `strict` the cached window, which may lack the hits of other
+    processes, is only trusted to reject: a hit it would accept is
+    checked again with `load`, so the limit holds across processes at
+    the cost of one `load` per accepted hit.
+
+    `acquire` checks and records a hit at once. Callers storing the hit
+    in the source of truth `check` first and `record` it once stored,
+    so a hit that fails to be stored isn't counted.
+    """
+
+    def __init__(
+        self, limit: int, window: float,
+        maxsize: int = 10000, ttl: Optional[float] = None, strict: bool = False
+    ):
+        self.limit = limit
+        self.window = window
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.strict = strict
+        self._windows: "OrderedDict[Hashable, Tuple[float, Deque[float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def _cached(self, key: Hashable, now: float) -> Optional[Deque[float]]:
+        item = self._windows.get(key)
+
+        if item is None or (self.ttl is not None and item[0] <= now):
+            return None
+
+        self._windows.move_to_end(key)
+        stamps = item[1]
+
+        while stamps and stamps[0] <= now - self.window:
+            stamps.popleft()
+
+        return stamps
+
+    async def _load(self, key: Hashable, now: float, load: Loader) -> Deque[float]:
+        self.misses += 1
+        stamps = deque(sorted(await load(now - self.window))[-self.limit:])
+        expires = (now + self.ttl) if self.ttl is not None else math.inf
+        self._windows[key] = (expires, stamps)
+        self._windows.move_to_end(key)
+
+        while len(self._windows) > self.maxsize:
+            self._windows.popitem(last=False)
+
+        return stamps
+
+    async def check(self, key: Hashable, load: Loader) -> Optional[float]:
+        """
+        The seconds to wait when the key is over the limit, or `None`
+        when a hit would be accepted. The hit isn't recorded.
+        """
+        now = time.time()
+        stamps = self._cached(key, now)
+
+        if stamps is not None and (len(stamps) >= self.limit or not self.strict):
+            self.hits += 1
+        else:
+            stamps = await self._load(key, now, load)
+
+        if len(stamps) >= self.limit:
+            self.rejected += 1
+            return stamps[0] + self.window - now
+
+        return None
+
+    def record(self, key: Hashable, stamp: Optional[float] = None):
+        """
+        Adds a hit at `stamp`, now by default, to the cached window of
+        the key.
+        """
+        item = self._windows.get(key)
+
+        if item is not None:
+            bisect.insort(item[1], time.time() if stamp is None else stamp)
+
+    async def acquire(self, key: Hashable, load: Loader) -> Optional[float]:
+        """
+        Records a hit and returns `None`, or the seconds to wait when
+        the key is over the limit.
+        """
+        retry_after = await self.check(key, load)
+
+        if retry_after is None:
+            self.record(key)
+
+        return retry_after
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            rejected=self.rejected,
+            size=len(self._windows)
+        )
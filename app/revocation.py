@@ -0,0 +1,172 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from . import models
+from .conf import settings
+from .sql import get_sessionmaker, primary_session
+from .util import the_ts_now
+from .util.bloom import ScalableBloomFilter, key_hashes
+
+__all__ = ('RevocationList', 'revocation_list')
+
+# Rows revoked this long before the last one seen are read again, for
+# clock skew and transactions committed late by other processes
+SYNC_OVERLAP = 60
+
+
+class RevocationList:
+    """
+    Denylist of revoked token IDs (`jti`). The `revoked_tokens` table is
+    the source of truth; in front of it a Bloom filter per `bucket`
+    seconds of token expiration answers "not revoked" from memory, only
+    filter hits are looked up in the table.
+
+    The filters grow with the revoked tokens and a bucket is dropped
+    whole once its tokens expired, so memory follows the live tokens.
+    Revocations of other processes are read every `sync` seconds.
+    """
+
+    def __init__(self, bucket: int, error_rate: float, sync: float):
+        self.bucket = bucket
+        self.error_rate = error_rate
+        self.sync_seconds = sync
+        self._buckets: Dict[int, ScalableBloomFilter] = {}
+        self._synced: Optional[int] = None
+        self._next_sync = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.negatives = 0
+        self.lookups = 0
+        self.false_positives = 0
+
+    def _add(self, jti: str, expires: int, dedupe: bool = True):
+        hashes = key_hashes(jti)
+        bloom = self._buckets.get(expires // self.bucket)
+
+        if bloom is None:
+            bloom = self._buckets[expires // self.bucket] = ScalableBloomFilter(self.error_rate)
+        elif dedupe and hashes in bloom:
+            # Already there, or a false positive that is looked up anyway
+            return
+
+        bloom.add(hashes)
+
+    def _drop_expired(self, now: int) -> bool:
+        expired = [bucket for bucket in self._buckets if (bucket + 1) * self.bucket <= now]
+
+        for bucket in expired:
+            del self._buckets[bucket]
+
+        return bool(expired)
+
+    async def sync(self, db: AsyncSession, force: bool = False):
+        """
+        Loads the revocations since the last sync, all of them the first
+        time. Requests arriving during a sync don't wait for it.
+        """
+        if not force and self._synced is not None and time.monotonic() < self._next_sync:
+            return
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        if self._lock.locked() and self._synced is not None:
+            return
+
+        async with self._lock:
+            if not force and self._synced is not None and time.monotonic() < self._next_sync:
+                return
+
+            RevokedToken = models.db.RevokedToken
+            now = the_ts_now()
+            since = (self._synced - SYNC_OVERLAP) if self._synced is not None else 0
+
+            async with primary_session(db) as primary:
+                rows = (
+                    await primary.execute(
+                        select(RevokedToken.jti, RevokedToken.expires, RevokedToken.revoked)
+                            .where((RevokedToken.revoked >= since) & (RevokedToken.expires > now))
+                    )
+                )\
+                    .all()
+
+            # The first load has no duplicates, later ones overlap
+            for row in rows:
+                self._add(row.jti, row.expires, self._synced is not None)
+
+            self._synced = max([row.revoked for row in rows] + [self._synced or 0])
+            self._next_sync = time.monotonic() + self.sync_seconds
+
+            if self._drop_expired(now):
+                # Not `db`, committing it would commit the request changes
+                async with get_sessionmaker()() as primary:
+                    await primary.execute(delete(RevokedToken).where(RevokedToken.expires <= now))
+                    await primary.commit()
+
+    async def init(self):
+        async with get_sessionmaker()() as db:
+            await self.sync(db, force=True)
+
+    async def is_revoked(self, db: AsyncSession, jti: str, expires: int) -> bool:
+        await self.sync(db)
+
+        bloom = self._buckets.get(expires // self.bucket)
+
+        if bloom is None or key_hashes(jti) not in bloom:
+            self.negatives += 1
+            return False
+
+        self.lookups += 1
+
+        # A replica may not have the revocation yet
+        async with primary_session(db) as primary:
+            revoked = await primary.get(models.db.RevokedToken, jti) is not None
+
+        if not revoked:
+            self.false_positives += 1
+
+        return revoked
+
+    async def revoke(self, db: AsyncSession, jti: str, expires: int) -> bool:
+        """
+        Revokes the token, `False` when it was already revoked. Checking
+        that is atomic, refresh rotation relies on it.
+        """
+        try:
+            await db.execute(
+                insert(models.db.RevokedToken)
+                    .values(jti=jti, expires=expires, revoked=the_ts_now())
+            )
+            await db.commit()
+            revoked = True
+        except IntegrityError:
+            await db.rollback()
+            revoked = False
+
+        self._add(jti, expires)
+
+        return revoked
+
+    def stats(self) -> Dict[str, Any]:
+        blooms = list(self._buckets.values())
+
+        return dict(
+            tokens=sum(bloom.count for bloom in blooms),
+            bytes=sum(bloom.nbytes for bloom in blooms),
+            buckets=len(blooms),
+            negatives=self.negatives,
+            lookups=self.lookups,
+            false_positives=self.false_positives
+        )
+
+
+revocation_list = RevocationList(
+    settings.jwt_denylist_bucket_seconds,
+    settings.jwt_denylist_error_rate,
+    settings.jwt_denylist_sync_seconds
+)
@@ -2,6 +2,7 @@ from fastapi import APIRouter
 
 from . import accounts
 from . import auth
+from . import metrics
 from . import users
 
 router = APIRouter(
@@ -12,4 +13,5 @@ router = APIRouter(
 
 router.include_router(accounts.router)
 router.include_router(auth.router)
+router.include_router(metrics.router)
 router.include_router(users.router)
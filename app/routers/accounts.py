@@ -1,17 +1,27 @@
-from typing import Sequence, Type, Optional
+from typing import Type, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from fastapi.params import Path, Query
-from fastapi_jwt_auth import AuthJWT
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy_future import paginate
-from fastapi_pagination import paginate as paginate_simple
-from sqlalchemy import func
+from fastapi_pagination import Page, Params
+from fastapi_pagination.ext.async_sqlalchemy import paginate
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from .. import models
-from ..util.sql import get_session, get_or_404, roles_or_403, create, partial_update
+from ..auth import JWTClaims, jwt_required
+from ..authorization import (
+    jwt_role, owned_accounts, resolve_role, roles_or_403, roles_or_account_owner_or_403
+)
+from ..cache import balance_cache
+from ..ledger import (
+    NOT_POSTED, Posting, PostingResult, cached_account, opening_balance,
+    post_transaction, post_transactions, running_balance_query
+)
+from ..statement import STATEMENT_MEDIA_TYPES, stream_statement
+from ..util.cursor import encode_cursor, decode_cursor
+from ..util.pagination import keyset_paginate
+from ..util.sql import get_session, create, partial_update, read_only
 
 router = APIRouter(
     prefix="/accounts", tags=["Account"],
@@ -24,65 +34,27 @@ class Parameters:
     class Query:
         start_ts = Query(None, description="Start timestamp (millis)", example=1234567890000)
         end_ts = Query(None, description="End timestamp (millis)",  example=9876543210000)
+        cursor = Query(None, description="Cursor of the page to retrieve")
+        size = Query(50, ge=1, le=100, description="Page size")
+        pagination = Query(
+            'page', regex='^(page|cursor)$',
+            description="`cursor` pages by keyset, with no `COUNT` per page"
+        )
+        total = Query(False, description="Estimated total in cursor pagination")
 
     class Path:
         account_number = Path(title="Account ID")
-
-
-async def account_owner_or_403(db: AsyncSession, user_id: int, account_number: str):
-    if not bool(
-        await db.execute(
-            select(func.count(models.db.Account.account_number))
-                .where(
-                    (models.db.Account.number == account_number)
-                )
-        ).scalar_one()
-    ):
-        raise HTTPException(404)
-
-    if not bool(
-        await db.execute(
-            select(func.count(models.db.UserAccounts.user_id))
-                .where(
-                    (models.db.UserAccount.user_id == user_id)
-                    & (models.db.UserAccount.account_number == account_number)
-                )
-        ).scalar_one()
-    ):
-        raise HTTPException(status_code=403, detail="Forbidden")
-
-
-async def roles_or_account_owner_or_403(
-    db: AsyncSession, roles: Sequence[str],
-    user_id: int, account_number: str,
-    check_enabled: bool = False
-):
-    try:
-        roles_or_403(db, roles)
-    except HTTPException:
-        if check_enabled:
-            account_is_enabled(db, account_number)
-
-        account_owner_or_403(db, user_id, account_number)
-
-
-async def account_is_enabled(db: AsyncSession, account_number):
-    if not await db.execute(
-        select(models.db.Account.enabled)
-            .where(
-                (models.db.Account.number == account_number)
-            )
-    ).scalar_one():
-        raise HTTPException(423, detail="Account disabled")
+        statement_extension = Path(title="Statement format", regex="^(ndjson|csv)$")
 
 
 async def account_transaction(
     db: AsyncSession, detail: models.TransactionDetail,
-    user_id: int, number: str, withdraw: bool = False
+    user_id: int, number: str, withdraw: bool = False,
+    role: Optional[str] = None
 ):
-    roles_or_account_owner_or_403(
+    await roles_or_account_owner_or_403(
         db, ("admin", "op"), user_id, number,
-        check_enabled=True
+        check_enabled=True, role=role
     )
 
     amount = detail.amount
@@ -90,99 +62,211 @@ async def account_transaction(
     if withdraw:
         amount *= -1
 
-    account: models.db.Account = (await db.execute(
-        select(models.db.Account)
-            .where(models.db.Account.number == number)
-    )).first()
-
-    if (account.current_amount + amount) < account.min_amount:
-        raise HTTPException(403, detail="The request operation exeeds the minimum account amount")
-
-    transaction = models.AccountTransaction(
-        account_number=number,
-        user=user_id,
-        description=detail.note,
-        amount=amount
+    return await post_transaction(
+        db, number, amount,
+        user_id=int(user_id),
+        description=detail.note
     )
 
-    db_row = await create(db, transaction, models.db.AccountTransactions)
 
-    return db_row
-
-
-@router.get('', tags=["Account"], response_model=Page[models.Account])
+@router.get(
+    '', tags=["Account"],
+    response_model=Union[Page[models.Account], models.CursorPage[models.Account]]
+)
 async def list_accounts(
-    auth: AuthJWT = Depends(), db: AsyncSession = Depends(get_session)
+    request: Request,
+    params: Params = Depends(),
+    pagination: str = Parameters.Query.pagination,
+    cursor: Optional[str] = Parameters.Query.cursor,
+    total: bool = Parameters.Query.total,
+    auth: JWTClaims = Depends(jwt_required), db: AsyncSession = Depends(get_session)
 ):
-    auth.jwt_required()
-    roles_or_403(db, ("admin", "operator"))
+    await roles_or_403(
+        db, ("admin", "operator"), auth.get_jwt_subject(), jwt_role(auth)
+    )
 
-    return paginate(
-        db, select(models.db.Account).order_by(
-            models.db.Account.name
+    Account = models.db.Account
+
+    if pagination == 'cursor' or cursor:
+        return await keyset_paginate(
+            db, request, select(Account), (Account.name, Account.number), 'accounts',
+            cursor, params.size, total
         )
+
+    return await paginate(
+        db, select(Account).order_by(
+            Account.name
+        ),
+        params
     )
 
 
 @router.post('', tags=["Account"], response_model=models.AccountTransaction)
 async def create_account(
-    account: models.Account, auth: AuthJWT = Depends(),
+    account: models.Account, auth: JWTClaims = Depends(jwt_required),
     db: AsyncSession = Depends(get_session)
 ) -> Type[models.Account]:
-    auth.jwt_required()
-    roles_or_403(db, ("admin", "operator"))
+    await roles_or_403(
+        db, ("admin", "operator"), auth.get_jwt_subject(), jwt_role(auth)
+    )
 
     return await create(db, account, models.db.Account)
 
 
-@router.get('/{number}', tags=["Account"], response_model=models.AccountTransaction)
-async def retrieve_account(
-    number: str = Parameters.Path.account_number, auth: AuthJWT = Depends(),
+@router.post(
+    '/batch-get', tags=["Account"],
+    response_model=models.BatchGetResponse[models.Account]
+)
+@read_only
+async def batch_get_accounts(
+    batch: models.BatchGetRequest, auth: JWTClaims = Depends(jwt_required),
     db: AsyncSession = Depends(get_session)
-) -> Type[models.Account]:
-    auth.jwt_required()
+):
+    """
+    Several accounts in one call, with a status per account number.
+    """
+    user_id = auth.get_jwt_subject()
+    numbers = list(dict.fromkeys(batch.keys))
+    role = jwt_role(auth) or await resolve_role(db, user_id)
+    owned = None
+
+    if role not in ("admin", "op"):
+        owned = await owned_accounts(db, user_id, numbers)
+
+    accounts = {
+        account.number: account
+        for account in (
+            await db.execute(
+                select(models.db.Account)
+                    .where(models.db.Account.number.in_(numbers))
+            )
+        )
+            .scalars()
+    }
 
-    roles_or_account_owner_or_403(
-        db, ("admin", "op"), auth.get_jwt_subject(), number
+    items = []
+
+    for number in batch.keys:
+        account = accounts.get(number)
+
+        if account is None:
+            items.append(models.BatchGetItem(key=number, status=404, detail="Not found"))
+        elif owned is not None and number not in owned:
+            items.append(models.BatchGetItem(key=number, status=403, detail="Forbidden"))
+        else:
+            items.append(models.BatchGetItem(key=number, status=200, data=account.dict()))
+
+    return models.BatchGetResponse(items=items)
+
+
+@router.post(
+    '/transactions/bulk', tags=["Account"],
+    response_model=models.BulkPostingResponse
+)
+async def bulk_account_transactions(
+    bulk: models.BulkPostingRequest, auth: JWTClaims = Depends(jwt_required),
+    db: AsyncSession = Depends(get_session)
+):
+    """
+    Many deposits and withdrawals in one database transaction, with a
+    status per posting. The affected accounts are authorized at once.
+    """
+    user_id = auth.get_jwt_subject()
+    atomic = bulk.mode == "all_or_nothing"
+    role = jwt_role(auth) or await resolve_role(db, user_id)
+    forbidden = set()
+
+    if role not in ("admin", "op"):
+        numbers = list(dict.fromkeys(posting.account_number for posting in bulk.postings))
+        forbidden = set(numbers) - await owned_accounts(db, user_id, numbers)
+
+    results = [
+        PostingResult(403, "Forbidden") if posting.account_number in forbidden else None
+        for posting in bulk.postings
+    ]
+
+    if atomic and forbidden:
+        results = [result or NOT_POSTED for result in results]
+    else:
+        allowed = [index for index, result in enumerate(results) if result is None]
+        posted = await post_transactions(
+            db,
+            [
+                Posting(
+                    account_number=posting.account_number,
+                    amount=-posting.amount if posting.operation == "withdraw" else posting.amount,
+                    description=posting.note,
+                    document=posting.document
+                )
+                for posting in (bulk.postings[index] for index in allowed)
+            ],
+            user_id=int(user_id), atomic=atomic
+        )
+
+        for index, result in zip(allowed, posted):
+            results[index] = result
+
+    return models.BulkPostingResponse(
+        posted=sum(1 for result in results if result.transaction is not None),
+        items=[
+            models.BulkPostingResult(
+                index=index, status=result.status,
+                detail=result.detail, transaction=result.transaction
+            )
+            for index, result in enumerate(results)
+        ]
     )
 
-    return await get_or_404(
-        db, models.db.Account,
-        (models.db.Account.number == number)
+
+@router.get('/{number}', tags=["Account"], response_model=models.Account)
+async def retrieve_account(
+    number: str = Parameters.Path.account_number, auth: JWTClaims = Depends(jwt_required),
+    db: AsyncSession = Depends(get_session)
+) -> Type[models.Account]:
+    await roles_or_account_owner_or_403(
+        db, ("admin", "op"), auth.get_jwt_subject(), number,
+        role=jwt_role(auth)
     )
 
+    account = await cached_account(db, number)
+
+    if account is None:
+        raise HTTPException(404)
+
+    return account
+
 
 @router.patch('/{number}', tags=["Account"], response_model=models.Account)
 async def partial_update_account(
     account: models.Account,
     number: str = Parameters.Path.account_number,
-    auth: AuthJWT = Depends(),
+    auth: JWTClaims = Depends(jwt_required),
     db: AsyncSession = Depends(get_session)
 ) -> Type[models.Account]:
-    auth.jwt_required()
-
-    roles_or_account_owner_or_403(
+    await roles_or_account_owner_or_403(
         db, ("admin", "op"), auth.get_jwt_subject(), number,
-        check_enabled=True
+        check_enabled=True, role=jwt_role(auth)
     )
 
-    return await partial_update(
+    db_row = await partial_update(
         db, account, models.db.Account,
         (models.db.Account.number == number)
     )
+    await balance_cache.delete(number)
+
+    return db_row
 
 
 @router.post('/{number}/deposit', tags=["Account"], response_model=models.AccountTransaction)
 async def account_deposit(
     detail: models.TransactionDetail,
     number: str = Parameters.Path.account_number,
-    auth: AuthJWT = Depends(),
+    auth: JWTClaims = Depends(jwt_required),
     db: AsyncSession = Depends(get_session)
 ) -> Type[models.AccountTransaction]:
-    auth.jwt_required()
-
     return await account_transaction(
-        db, detail, auth.get_jwt_subject(), number
+        db, detail, auth.get_jwt_subject(), number,
+        role=jwt_role(auth)
     )
 
 
@@ -190,50 +274,109 @@ async def account_deposit(
 async def account_withdraw(
     detail: models.TransactionDetail,
     number: str = Parameters.Path.account_number,
-    auth: AuthJWT = Depends(),
+    auth: JWTClaims = Depends(jwt_required),
     db: AsyncSession = Depends(get_session)
 ) -> Type[models.AccountTransaction]:
-    auth.jwt_required()
-
     return await account_transaction(
         db, detail, auth.get_jwt_subject(), number,
-        withdraw=True
+        withdraw=True, role=jwt_role(auth)
     )
 
 
-@router.get('/{number}/balance', tags=["Account"], response_model=Page[models.AccountBalanceTransaction])
+@router.get(
+    '/{number}/balance', tags=["Account"],
+    response_model=models.CursorPage[models.AccountBalanceTransaction]
+)
 async def list_account_balance(
+    request: Request,
     number: str = Parameters.Path.account_number,
     start_ts: Optional[int] = Parameters.Query.start_ts,
     end_ts: Optional[int] = Parameters.Query.end_ts,
-    auth: AuthJWT = Depends(), db: AsyncSession = Depends(get_session)
+    cursor: Optional[str] = Parameters.Query.cursor,
+    size: int = Parameters.Query.size,
+    auth: JWTClaims = Depends(jwt_required), db: AsyncSession = Depends(get_session)
 ):
     """
-    This function surely can be optimizable
+    Transactions with the running account amount, computed by the
+    database and paginated by the `(date, id)` keyset.
     """
-    auth.jwt_required()
-
-    roles_or_account_owner_or_403(
+    await roles_or_account_owner_or_403(
         db, ("admin", "op"), auth.get_jwt_subject(), number,
-        check_enabled=True
+        check_enabled=True, role=jwt_role(auth)
     )
 
-    query = select(models.db.AccountTransaction) \
-        .where(models.db.AccountTransaction.account_number == number) \
-        .order_by(models.db.AccountTransaction.date)
+    after = None
 
-    results = db.exec(query)
-    tx_list = []
-    current_amount = 0
+    if cursor:
+        values = decode_cursor(cursor)
 
-    for tx in results:
-        tx_dict = tx.dict()
-        tx_dict['account_amount'] = (current_amount := (current_amount + tx.amount))
+        if len(values) != 5 or values[0] != 'balance' or values[1] != number:
+            raise HTTPException(400, detail="Invalid cursor")
 
-        if (
-            (not start_ts or tx.date >= start_ts)
-            or (not end_ts or tx.date <= end_ts)
-        ):
-            tx_list.append(tx_dict)
+        last_date, last_id, account_amount = values[2:]
+        after = (last_date, last_id)
+    else:
+        account_amount = await opening_balance(db, number, start_ts)
 
-    return paginate_simple(tx_list)
+    query = running_balance_query(
+        number, account_amount, start_ts, end_ts, after
+    ) \
+        .limit(size + 1)
+
+    rows = (await db.execute(query)).all()
+    tx_list = [
+        dict(tx.dict(), account_amount=amount)
+        for tx, amount in rows[:size]
+    ]
+
+    next_cursor = None
+
+    if len(rows) > size:
+        last = tx_list[-1]
+        next_cursor = encode_cursor(
+            ('balance', number, last['date'], last['id'], last['account_amount'])
+        )
+
+    return models.CursorPage(
+        items=tx_list, size=size, cursor=next_cursor,
+        next=(
+            str(request.url.include_query_params(cursor=next_cursor))
+            if next_cursor else None
+        )
+    )
+
+
+@router.get(
+    '/{number}/statement.{extension}', tags=["Account"],
+    response_class=StreamingResponse,
+    responses={200: {"content": {media_type: {} for media_type in STATEMENT_MEDIA_TYPES.values()}}}
+)
+async def account_statement(
+    number: str = Parameters.Path.account_number,
+    extension: str = Parameters.Path.statement_extension,
+    start_ts: Optional[int] = Parameters.Query.start_ts,
+    end_ts: Optional[int] = Parameters.Query.end_ts,
+    auth: JWTClaims = Depends(jwt_required), db: AsyncSession = Depends(get_session)
+):
+    """
+    Full statement with the running account amount as NDJSON or CSV,
+    streamed with constant memory.
+    """
+    await roles_or_account_owner_or_403(
+        db, ("admin", "op"), auth.get_jwt_subject(), number,
+        check_enabled=True, role=jwt_role(auth)
+    )
+
+    if await cached_account(db, number) is None:
+        raise HTTPException(404)
+
+    return StreamingResponse(
+        stream_statement(
+            number, extension, start_ts, end_ts,
+            replica=db.info.get('replica', False)
+        ),
+        media_type=STATEMENT_MEDIA_TYPES[extension],
+        headers={
+            "Content-Disposition": 'attachment; filename="statement-%s.%s"' % (number, extension)
+        }
+    )
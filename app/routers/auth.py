@@ -1,10 +1,16 @@
+from typing import Optional
+
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi_jwt_auth import AuthJWT
+from fastapi_jwt_auth.exceptions import RevokedTokenError
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from .. import models
-from ..util import hash_passwd
+from ..auth import JWTClaims, jwt_refresh_required, jwt_required
+from ..revocation import revocation_list
+from ..util.hashing import password_hasher
 from ..util.sql import get_session
 
 router = APIRouter(
@@ -14,11 +20,14 @@ router = APIRouter(
 )
 
 
-def create_token_response(auth: AuthJWT, subject) -> models.JWTToken:
+def create_token_response(auth: AuthJWT, subject, role: Optional[str] = None) -> models.JWTToken:
+    # The role claim lets role checks skip the database
+    user_claims = {'role': role} if role else {}
+
     return models.JWTToken(
-        access_token=auth.create_access_token(subject=subject),
+        access_token=auth.create_access_token(subject=subject, user_claims=user_claims),
         access_token_expires=auth._get_expired_time("access") * 1000,
-        refresh_token=auth.create_refresh_token(subject=subject),
+        refresh_token=auth.create_refresh_token(subject=subject, user_claims=user_claims),
         refresh_token_expires=auth._get_expired_time("refresh") * 1000
     )
 
@@ -31,29 +40,87 @@ async def login(
     login: models.Login, auth: AuthJWT = Depends(),
     db: AsyncSession = Depends(get_session)
 ):
-    user: models.db.User = (
+    user = (
         await db.execute(
-            select(models.db.User).where(
-                models.db.User.country_commercial_id == login.username
-                & models.db.User.password == hash_passwd(login.password)
+            select(
+                models.db.User.id, models.db.User.role, models.db.User.password
             )
+                .where(models.db.User.country_commercial_id == login.username)
         )
     )\
         .first()
 
-    if not user:
+    if not await password_hasher.verify(login.password, user and user.password):
         raise HTTPException(
             status_code=401, detail="Bad username or password"
         )
 
-    return create_token_response(auth, str(user.id))
+    # Legacy hashes and those of older parameters are upgraded on login,
+    # unless the password changed meanwhile
+    if password_hasher.needs_rehash(user.password):
+        await db.execute(
+            update(models.db.User)
+                .where(models.db.User.id == user.id)
+                .where(models.db.User.password == user.password)
+                .values(password=await password_hasher.hash(login.password))
+        )
+        await db.commit()
+
+    return create_token_response(auth, str(user.id), user.role)
 
 
 @router.post(
     '/refresh', tags=["Auth"],
     response_model=models.JWTToken
 )
-def refresh(auth: AuthJWT = Depends()):
-    auth.jwt_refresh_token_required()
+async def refresh(
+    auth: AuthJWT = Depends(jwt_refresh_required),
+    db: AsyncSession = Depends(get_session)
+):
+    raw = auth.get_raw_jwt()
+
+    # The role claim is trusted until the token expires, it is read again
+    # so demoted or disabled users don't keep it by refreshing
+    user = (
+        await db.execute(
+            select(models.db.User.role, models.db.User.enabled)
+                .where(models.db.User.id == int(raw['sub']))
+        )
+    )\
+        .first()
+
+    if user is None or not user.enabled:
+        raise HTTPException(status_code=401, detail="User disabled")
+
+    # Rotation, a refresh token is good for one refresh only
+    if not await revocation_list.revoke(db, raw['jti'], raw['exp']):
+        raise RevokedTokenError(status_code=401, message="Token has been revoked")
+
+    return create_token_response(auth, raw['sub'], user.role)
+
+
+@router.post(
+    '/logout', tags=["Auth"],
+    response_model=models.MessageOutput
+)
+async def logout(
+    logout: Optional[models.Logout] = None,
+    claims: JWTClaims = Depends(jwt_required), auth: AuthJWT = Depends(),
+    db: AsyncSession = Depends(get_session)
+):
+    """
+    Revokes the access token and, when given, the refresh token.
+    """
+    if logout and logout.refresh_token:
+        refresh_claims = auth.get_raw_jwt(logout.refresh_token)
+
+        if refresh_claims.get('type') != 'refresh' \
+            or refresh_claims.get('sub') != claims.get_jwt_subject() \
+        :
+            raise HTTPException(422, detail="Not a refresh token of this user")
+
+        await revocation_list.revoke(db, refresh_claims['jti'], refresh_claims['exp'])
+
+    await revocation_list.revoke(db, claims.raw['jti'], claims.raw['exp'])
 
-    return create_token_response(auth, auth.get_jwt_subject())
+    return models.MessageOutput(detail="Logged out")
@@ -0,0 +1,48 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Security
+from fastapi.responses import PlainTextResponse
+from fastapi_jwt_auth import AuthJWT
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import metrics as app_metrics
+from ..auth import bearer_scheme, jwt_required
+from ..authorization import jwt_role, roles_or_403
+from ..conf import settings
+from ..util.sql import get_session
+
+router = APIRouter(
+    prefix="/metrics", tags=["Metrics"],
+    responses={404: {"detail": "Not found"}},
+)
+
+
+async def scraper_or_admin(
+    auth: AuthJWT = Depends(), authorization: Optional[str] = Security(bearer_scheme),
+    db: AsyncSession = Depends(get_session)
+):
+    """
+    The `metrics_token` of the Prometheus scraper, or an admin token.
+    """
+    if settings.metrics_token and authorization and hmac.compare_digest(
+        authorization.encode(), ('Bearer %s' % settings.metrics_token).encode()
+    ):
+        return
+
+    claims = await jwt_required(auth, authorization, db)
+    await roles_or_403(db, ("admin",), claims.get_jwt_subject(), jwt_role(claims))
+
+
+@router.get(
+    '', tags=["Metrics"], response_class=PlainTextResponse,
+    dependencies=[Depends(scraper_or_admin)]
+)
+async def metrics():
+    """
+    Request, pool, cache and rate limit metrics in the Prometheus text
+    format, aggregated over the workers in multiprocess mode.
+    """
+    return PlainTextResponse(
+        app_metrics.registry.exposition(), media_type=app_metrics.CONTENT_TYPE
+    )
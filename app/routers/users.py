@@ -1,20 +1,28 @@
-import os
-from functools import wraps
+import math
+from functools import partial, wraps
+from typing import Optional, Union
 
-import chevron
-import emails
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi_jwt_auth import AuthJWT
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy_future import paginate
-from sqlalchemy import func
+from fastapi_pagination import Page, Params
+from fastapi_pagination.ext.async_sqlalchemy import paginate
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from .. import models
+from ..auth import JWTClaims, jwt_optional, jwt_required, reject_revoked
 from ..conf import settings
-from ..util import project_root_path, strip_tags, the_now
-from ..util.sql import partial_update, get_or_404, get_session
+from ..mail import enqueue, mail_templates, outbox_worker
+from ..ratelimit import SlidingWindowLimiter
+from ..util import the_now
+from ..util.hashing import password_hasher
+from ..util.pagination import keyset_order, keyset_paginate
+from ..util.serialization import TrustedJSONResponse
+from ..util.sql import create, partial_update, get_or_404, get_session, read_only
+
+password_request_limiter = SlidingWindowLimiter(
+    settings.user_password_request_max_per_day, 24 * 60 * 60, strict=True
+)
 
 router = APIRouter(
     prefix="/users", tags=["User"],
@@ -23,6 +31,20 @@ router = APIRouter(
 )
 
 
+async def password_requests_since(db: AsyncSession, user_id: int, since: float):
+    return (
+        await db.execute(
+            select(models.db.UserPasswordChange.created)
+                .where(
+                    (models.db.UserPasswordChange.user_id == user_id)
+                    & (models.db.UserPasswordChange.created >= since)
+                )
+        )
+    )\
+        .scalars()\
+        .all()
+
+
 def check_username(fn):
     @wraps(fn)
     async def _check_username_view(*args, **kwargs):
@@ -46,42 +68,59 @@ def check_username(fn):
     return _check_username_view
 
 
-@router.get('', tags=["User"], response_model=Page[models.User])
-async def list_users(db: AsyncSession = Depends(get_session)):
-    return paginate(
-        db, select(models.db.User).order_by(
-            models.db.User.first_surname, models.db.User.last_surname,
-            models.db.User.first_company_name, models.db.User.following_names
-        )
+@router.get(
+    '', tags=["User"],
+    response_model=Union[Page[models.User], models.CursorPage[models.User]]
+)
+async def list_users(
+    request: Request,
+    params: Params = Depends(),
+    pagination: str = Query(
+        'page', regex='^(page|cursor)$',
+        description="`cursor` pages by keyset, with no `COUNT` per page"
+    ),
+    cursor: Optional[str] = Query(None, description="Cursor of the page to retrieve"),
+    total: bool = Query(False, description="Estimated total in cursor pagination"),
+    db: AsyncSession = Depends(get_session)
+):
+    User = models.db.User
+    sort_key = (
+        User.first_surname, User.last_surname,
+        User.first_company_name, User.following_names, User.id
     )
 
+    if pagination == 'cursor' or cursor:
+        page = await keyset_paginate(
+            db, request, select(User), sort_key, 'users',
+            cursor, params.size, total
+        )
+    else:
+        page = await paginate(db, select(User).order_by(*keyset_order(sort_key[:-1])), params)
+
+    # Rows were validated on the way in
+    return TrustedJSONResponse(page, models.User)
+
 
 @router.post('', tags=["User"], response_model=models.User)
 @check_username
 async def create_user(
-    user: models.User, auth: AuthJWT = Depends(),
+    user: models.User, auth: AuthJWT = Depends(jwt_optional),
     db: AsyncSession = Depends(get_session)
 ) -> models.User:
     if settings.user_create_without_auth.lower() \
         in ('', 'false', 'no', 'n', '0') \
     :
         auth.jwt_required()
+        await reject_revoked(db, auth.get_raw_jwt())
 
-    db_user = models.db.User(**user.dict(skip_defaults=True))
-    db.add(db_user)
-
-    await db.commit()
-    await db.update(db_user)
-
-    return db_user
+    return await create(db, user, models.db.User)
 
 
 @router.get('/me', tags=["User"], response_model=models.User)
 async def retrieve_me(
-    auth: AuthJWT = Depends(),
+    auth: JWTClaims = Depends(jwt_required),
     db: AsyncSession = Depends(get_session)
 ) -> models.User:
-    auth.jwt_required()
     return await get_or_404(
         db, models.db.User,
         (models.db.User.id == auth.get_jwt_subject())
@@ -91,22 +130,53 @@ async def retrieve_me(
 @router.patch('/me', tags=["User"], response_model=models.User)
 @check_username
 async def partial_update_me(
-    user: models.PartialUser, auth: AuthJWT = Depends(),
+    user: models.PartialUser, auth: JWTClaims = Depends(jwt_required),
     db: AsyncSession = Depends(get_session)
 ) -> models.User:
-    auth.jwt_required()
     return await partial_update(
         db, user, models.db.User,
         (models.db.User.id == auth.get_jwt_subject())
     )
 
 
+@router.post(
+    '/batch-get', tags=["User"],
+    response_model=models.BatchGetResponse[models.User]
+)
+@read_only
+async def batch_get_users(
+    batch: models.BatchGetRequest, auth: JWTClaims = Depends(jwt_required),
+    db: AsyncSession = Depends(get_session)
+):
+    """
+    Several users by commercial ID in one call, with a status per ID.
+    """
+    users = {
+        user.country_commercial_id: user
+        for user in (
+            await db.execute(
+                select(models.db.User)
+                    .where(models.db.User.country_commercial_id.in_(set(batch.keys)))
+            )
+        )
+            .scalars()
+    }
+
+    return models.BatchGetResponse(
+        items=[
+            models.BatchGetItem(key=key, status=200, data=users[key].dict())
+            if key in users else
+            models.BatchGetItem(key=key, status=404, detail="Not found")
+            for key in batch.keys
+        ]
+    )
+
+
 @router.get('/{country_commercial_id}', tags=["User"], response_model=models.User)
 async def retrieve_user(
-    country_commercial_id: str, auth: AuthJWT = Depends(),
+    country_commercial_id: str, auth: JWTClaims = Depends(jwt_required),
     db: AsyncSession = Depends(get_session)
 ) -> models.User:
-    auth.jwt_required()
     return await get_or_404(
         db, models.db.User,
         (models.db.User.country_commercial_id == country_commercial_id)
@@ -117,11 +187,9 @@ async def retrieve_user(
 @check_username
 async def partial_update_user(
     country_commercial_id: str,
-    user: models.PartialUser, auth: AuthJWT = Depends(),
+    user: models.PartialUser, auth: JWTClaims = Depends(jwt_required),
     db: AsyncSession = Depends(get_session)
 ) -> models.User:
-    auth.jwt_required()
-
     return await partial_update(
         db, user, models.db.User,
         (models.db.User.country_commercial_id == country_commercial_id)
@@ -140,70 +208,71 @@ async def change_password_request(
     request_password_change: models.UserPasswordChangeRequest,
     db: AsyncSession = Depends(get_session)
 ):
-    user = get_or_404(
-        db, models.db.User,
-        (models.db.User.country_commercial_id == request_password_change.country_commercial_id)
+    # Locked until the commit, concurrent requests of the user are
+    # counted one after the other
+    user = (
+        await db.execute(
+            select(models.db.User)
+                .where(
+                    models.db.User.country_commercial_id
+                    == request_password_change.country_commercial_id
+                )
+                .with_for_update()
+        )
+    )\
+        .scalars()\
+        .first()
+
+    if not user:
+        raise HTTPException(404)
+
+    retry_after = await password_request_limiter.check(
+        user.id, partial(password_requests_since, db, user.id)
     )
 
-    if (
-        (await db.execute(select(func.count(models.db.User.id))).scalar_one())
-        >= settings.user_password_request_max_per_day
-    ):
+    if retry_after is not None:
         raise HTTPException(
-            status_code=429, detail="Enough password requests for today"
+            status_code=429, detail="Enough password requests for today",
+            headers={"Retry-After": str(math.ceil(retry_after))}
         )
 
-    user_password_change = models.db.UserPasswordChange(user=user.id)
-    await user_password_change.save()
-
-    try:
-        with open(os.path.join(project_root_path(), 'templates', 'mail', 'change-password.html'), "r") as template:
-            mail_html = chevron.render(
-                template,
-                {
-                    'mail_static_base': settings.mail_from,
-                    'first_name': user.first_name,
-                    'last_name': user.last_name,
-                    'set_password_link': settings.frontend_change_password_url \
-                        .format(key=user_password_change.id),
-                    'set_password_key': user_password_change.id
-                }
-            )
-
-        message = emails.Message(
-            text=strip_tags(mail_html),
-            html=mail_html,
-            mail_from=("Banku", os.getenv('MAIL_FROM', '')),
-            subject="Recuperar contraseña en Banku"
-        )
+    user_password_change = models.db.UserPasswordChange(user_id=user.id)
+    db.add(user_password_change)
+
+    mail_html, mail_text = mail_templates.render(
+        'change-password',
+        {
+            'mail_static_base': settings.mail_from,
+            'first_name': user.first_company_name,
+            'last_name': user.first_surname,
+            'set_password_link': settings.frontend_change_password_url \
+                .format(key=user_password_change.id),
+            'set_password_key': user_password_change.id
+        }
+    )
 
-        for i in range(3):
-            response = message.send(
-                to=user.email,
-                smtp={
-                    "host": 'smtp.gmail.com', "tls": True, "port": 587,
-                    "user": settings.mail_from, "password": settings.mail_pass
-                }
-            )
+    enqueue(
+        db, user.email, "Recuperar contraseña en Banku",
+        html=mail_html, text=mail_text
+    )
 
-            if response.status_code == 250:
-                break
+    created = user_password_change.created
+    await db.commit()
+    password_request_limiter.record(user.id, created)
+    outbox_worker.wake()
 
-        if response.status_code != 250:
-            raise ValueError("%s: %s" % (response.status_code, response.status_text))
-    except:
-        import traceback as tb
-        tb.print_exc()
+    return models.MessageOutput(detail="Successfully created")
 
-        await user_password_change.delete()
 
-        raise HTTPException(
-            status_code=500, detail="Unexpected internal error, try again"
-        )
-    else:
-        raise HTTPException(
-            status_code=201, detail="Successfully created"
+async def password_change_or_404(db: AsyncSession, key: str) -> models.db.UserPasswordChange:
+    return await get_or_404(
+        db, models.db.UserPasswordChange,
+        (
+            (models.db.UserPasswordChange.id == key)
+            & (models.db.UserPasswordChange.burned == False)
+            & (models.db.UserPasswordChange.expires > the_now())
         )
+    )
 
 
 @router.post('/change-password/{key}', tags=["User"], responses={200: {"model": models.MessageOutput}})
@@ -211,27 +280,18 @@ async def change_password_set(
     key: str, password_change_input: models.UserPasswordChangeInput,
     db: AsyncSession = Depends(get_session)
 ):
-    change_password_request = await get_or_404(
-        db, models.db.UserPasswordChange,
-        (
-            (models.db.UserPasswordChange.id == key)
-            & (models.db.UserPasswordChange.burned == False)
-            & (models.db.UserPasswordChange.expires < the_now())
-        )
-    )
+    change_password_request = await password_change_or_404(db, key)
     user = await get_or_404(
         db, models.db.User,
-        (models.db.User.country_commercial_id == change_password_request.user_id)
+        (models.db.User.id == change_password_request.user_id)
     )
 
-    user.password = password_change_input.password
-    password_change_input.burned = True
+    user.password = await password_hasher.hash(password_change_input.password)
+    change_password_request.burned = True
 
-    db.add(password_change_input)
+    db.add(change_password_request)
     db.add(user)
 
     await db.commit()
-    await db.refresh(password_change_input)
-    await db.refresh(user)
 
     raise HTTPException(200, detail="Success")
@@ -1,17 +1,252 @@
-from sqlmodel import create_engine, SQLModel
-from .conf import settings
-from sqlalchemy.ext.asyncio import create_async_engine
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel import SQLModel
 
+from .conf import settings
 
-engine = create_async_engine(
-    settings.database_default_url,
-    echo=settings.sql_echo.lower() in ('yes', 'y', 't', 'true'),
-    future=True
+__all__ = (
+    'Replica', 'get_engine', 'get_sessionmaker', 'get_replica', 'read_session', 'primary_session',
+    'replica_stats', 'pool_stats', 'init', 'dispose'
 )
 
+logger = logging.getLogger(__name__)
+
+# Errors of the replica itself rather than of the query
+REPLICA_ERRORS = (exc.OperationalError, exc.InterfaceError, ConnectionError, TimeoutError)
+
+
+class PoolWaitStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.timeouts = 0
+
+    def record(self, elapsed: float, timeout: bool = False):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.timeouts += int(timeout)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that measures how long checkouts wait for a connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timeout = False
+
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timeout = True
+            raise
+        finally:
+            self.wait_stats.record(time.perf_counter() - started, timeout)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+
+class Replica:
+    """
+    Read replica engine. A connection error ejects it from the rotation
+    for `database_replica_eject_seconds`, then it is tried again.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = create_async_engine(url, **_engine_options(url))
+        self.sessionmaker = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_until <= time.monotonic()
+
+    def eject(self, error: BaseException):
+        self.ejected_until = time.monotonic() + settings.database_replica_eject_seconds
+        self.ejections += 1
+        logger.warning(
+            "Replica %s ejected for %.0fs: %s",
+            make_url(self.url).render_as_string(hide_password=True),
+            settings.database_replica_eject_seconds, error
+        )
+
+
+class _ProcessState:
+    pid: Optional[int] = None
+    engine: Optional[AsyncEngine] = None
+    sessionmaker: Optional[sessionmaker] = None
+    replicas: List[Replica] = []
+    next_replica: int = 0
+
+
+_state = _ProcessState()
+
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    options: Dict[str, Any] = dict(
+        echo=settings.sql_echo.lower() in ('yes', 'y', 't', 'true'),
+        future=True
+    )
+    parsed = make_url(url)
+
+    # In-memory SQLite has a single static connection, nothing to pool
+    if parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+        return options
+
+    return dict(
+        options,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.database_pool_size,
+        max_overflow=settings.database_max_overflow,
+        pool_timeout=settings.database_pool_timeout,
+        pool_recycle=settings.database_pool_recycle,
+        pool_pre_ping=settings.database_pool_pre_ping,
+    )
+
+
+def get_engine() -> AsyncEngine:
+    """
+    Engine of the current process, built on first use so every uvicorn
+    worker owns its pool instead of inheriting connections from a fork.
+    """
+    if _state.pid != os.getpid():
+        _state.pid = os.getpid()
+        _state.engine = create_async_engine(
+            settings.database_default_url,
+            **_engine_options(settings.database_default_url)
+        )
+        _state.sessionmaker = sessionmaker(
+            _state.engine, class_=AsyncSession, expire_on_commit=False
+        )
+        _state.replicas = [
+            Replica(url.strip())
+            for url in settings.database_replica_urls.split(',')
+            if url.strip()
+        ]
+
+    return _state.engine
+
+
+def get_sessionmaker() -> sessionmaker:
+    get_engine()
+    return _state.sessionmaker
+
+
+def get_replica() -> Optional[Replica]:
+    """
+    Next healthy replica, round robin, `None` when there is none.
+    """
+    get_engine()
+    replicas = _state.replicas
+
+    for _ in range(len(replicas)):
+        replica = replicas[_state.next_replica % len(replicas)]
+        _state.next_replica += 1
+
+        if replica.healthy:
+            return replica
+
+    return None
+
+
+@asynccontextmanager
+async def read_session() -> AsyncIterator[AsyncSession]:
+    """
+    Session on a healthy replica, ejecting it when it fails, or on the
+    primary when there is none. `session.info['replica']` tells which.
+    """
+    replica = get_replica()
+
+    if replica is None:
+        async with get_sessionmaker()() as session:
+            yield session
+
+        return
+
+    async with replica.sessionmaker() as session:
+        session.info['replica'] = True
+
+        try:
+            yield session
+        except REPLICA_ERRORS as error:
+            replica.eject(error)
+            raise
+
+
+@asynccontextmanager
+async def primary_session(db: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """
+    `db` when it is on the primary, else a new session there, for reads
+    a lagging replica can't answer.
+    """
+    if not db.info.get('replica'):
+        yield db
+        return
+
+    async with get_sessionmaker()() as session:
+        yield session
+
+
+def replica_stats() -> List[Dict[str, Any]]:
+    get_engine()
+
+    return [
+        dict(replica=str(i), healthy=replica.healthy, ejections=replica.ejections)
+        for i, replica in enumerate(_state.replicas)
+    ]
+
+
+def pool_stats() -> Dict[str, Any]:
+    pool = get_engine().pool
+    stats: Dict[str, Any] = dict(pool=type(pool).__name__)
+
+    if isinstance(pool, InstrumentedQueuePool):
+        wait_stats = pool.wait_stats
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            wait_count=wait_stats.count,
+            wait_seconds_total=wait_stats.total,
+            wait_seconds_max=wait_stats.max,
+            wait_timeouts=wait_stats.timeouts,
+        )
+
+    return stats
+
 
 async def init():
+    get_engine()
     # If you dont want to use migrations
-    #async with engine.begin() as conn:
+    #async with get_engine().begin() as conn:
     #    await conn.run_sync(SQLModel.metadata.create_all)
-    pass
+
+
+async def dispose():
+    if _state.engine is not None and _state.pid == os.getpid():
+        await _state.engine.dispose()
+
+        for replica in _state.replicas:
+            await replica.engine.dispose()
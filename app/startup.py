@@ -0,0 +1,71 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Dict, Optional
+
+from fastapi import FastAPI
+
+__all__ = ('timed_startup', 'StartupOnce')
+
+logger = logging.getLogger(__name__)
+
+
+def _handler_name(handler) -> str:
+    owner = getattr(handler, '__self__', None)
+    name = getattr(handler, '__qualname__', repr(handler))
+
+    if owner is not None and not inspect.isclass(owner):
+        name = '%s.%s' % (type(owner).__name__, handler.__name__)
+
+    return '%s.%s' % (getattr(handler, '__module__', '?'), name)
+
+
+async def timed_startup(app: FastAPI) -> Dict[str, float]:
+    """
+    Runs the startup handlers like `app.router.startup()` and returns
+    the seconds each one took.
+    """
+    breakdown: Dict[str, float] = {}
+
+    for handler in app.router.on_startup:
+        started = time.perf_counter()
+        result = handler()
+
+        if inspect.isawaitable(result):
+            await result
+
+        breakdown[_handler_name(handler)] = time.perf_counter() - started
+
+    return breakdown
+
+
+class StartupOnce:
+    """
+    Runs the app startup once per process, concurrent first requests
+    wait for the same run.
+    """
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+        self.breakdown: Optional[Dict[str, float]] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def __call__(self) -> Dict[str, float]:
+        if self.breakdown is not None:
+            return self.breakdown
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self.breakdown is None:
+                breakdown = await timed_startup(self.app)
+                logger.info(
+                    "Startup took %.1fms: %s",
+                    sum(breakdown.values()) * 1000,
+                    ", ".join("%s %.1fms" % (name, elapsed * 1000) for name, elapsed in breakdown.items())
+                )
+                self.breakdown = breakdown
+
+        return self.breakdown
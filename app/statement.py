@@ -0,0 +1,77 @@
+import csv
+import io
+from typing import AsyncIterator, Optional, Sequence
+
+import orjson
+from sqlalchemy.engine import Row
+
+from . import models
+from .conf import settings
+from .ledger import opening_balance, running_balance_query
+from .sql import get_sessionmaker, read_session
+
+__all__ = ('STATEMENT_MEDIA_TYPES', 'STATEMENT_FIELDS', 'stream_statement')
+
+STATEMENT_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+STATEMENT_FIELDS = (
+    'id', 'date', 'account_number', 'user', 'document', 'description',
+    'amount', 'account_amount'
+)
+
+
+def _ndjson_chunk(rows: Sequence[Row]) -> bytes:
+    return b''.join(
+        orjson.dumps(dict(row._mapping), option=orjson.OPT_APPEND_NEWLINE)
+        for row in rows
+    )
+
+
+def _csv_chunk(rows: Sequence[Row], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if header:
+        writer.writerow(STATEMENT_FIELDS)
+
+    writer.writerows(rows)
+
+    return buffer.getvalue().encode()
+
+
+async def stream_statement(
+    account_number: str, extension: str,
+    start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+    chunk_size: Optional[int] = None, replica: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Transactions with the running account amount read from a
+    server-side cursor and serialized `chunk_size` rows at a time, so
+    memory doesn't grow with the history. The session is its own, it
+    must outlive the request handler, on a replica when `replica`.
+    """
+    AccountTransaction = models.db.AccountTransaction
+    chunk_size = chunk_size or settings.statement_chunk_size
+
+    async with (read_session() if replica else get_sessionmaker()()) as db:
+        account_amount = await opening_balance(db, account_number, start_ts)
+        result = await db.stream(
+            running_balance_query(
+                account_number, account_amount, start_ts, end_ts,
+                columns=[getattr(AccountTransaction, field) for field in STATEMENT_FIELDS[:-1]]
+            )
+                .execution_options(yield_per=chunk_size)
+        )
+        header = True
+
+        async for rows in result.partitions():
+            if extension == 'csv':
+                yield _csv_chunk(rows, header)
+                header = False
+            else:
+                yield _ndjson_chunk(rows)
+
+        if header and extension == 'csv':
+            yield _csv_chunk((), header)
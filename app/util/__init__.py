@@ -17,7 +17,7 @@ def the_now() -> datetime.datetime:
 
 
 def the_ts_now() -> int:
-    return the_now().timestamp()
+    return int(the_now().timestamp())
 
 
 def date_tz_or_diff(
@@ -45,13 +45,12 @@ def date_tz_or_diff(
 
 
 def hash_passwd(passwd: Union[str, bytes]):
-    if not isinstance(passwd, bytes):
-        passwd = passwd.encode()
+    """
+    Blocking hash, in async code await `password_hasher.hash` instead.
+    """
+    from .hashing import password_hasher
 
-    return hashlib.pbkdf2_hmac(
-        "sha256", passwd,
-        settings.app_secret_key, 512
-    ).hex()
+    return password_hasher.hash_sync(passwd)
 
 
 def strip_tags(html):
@@ -65,9 +64,19 @@ def strip_tags(html):
                 self.strict = False
                 self.convert_charrefs = True
                 self.text = StringIO()
+                self.skip = 0
+
+            def handle_starttag(self, tag, attrs):
+                if tag in ('style', 'script', 'title'):
+                    self.skip += 1
+
+            def handle_endtag(self, tag):
+                if tag in ('style', 'script', 'title') and self.skip:
+                    self.skip -= 1
 
             def handle_data(self, d):
-                self.text.write(d)
+                if not self.skip:
+                    self.text.write(d)
 
             def get_data(self):
                 return self.text.getvalue()
@@ -92,3 +101,10 @@ def password_change_request_expiracy() -> datetime:
 
 def password_request_key() -> str:
     return hashlib.sha512(uuid1().hex.encode() + os.urandom(128)).hexdigest()
+
+
+def token_digest(authorization: str) -> bytes:
+    """
+    Key of a bearer token for in-memory maps, the token itself isn't kept.
+    """
+    return hashlib.sha256(authorization.encode()).digest()
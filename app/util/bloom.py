@@ -0,0 +1,80 @@
+import hashlib
+import math
+from typing import List, Tuple
+
+__all__ = ('BloomFilter', 'ScalableBloomFilter', 'key_hashes')
+
+Hashes = Tuple[int, int]
+
+
+def key_hashes(key: str) -> Hashes:
+    """
+    Two independent hashes of `key`, every bit position of every filter
+    is derived from them (Kirsch-Mitzenmacher double hashing).
+    """
+    digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class BloomFilter:
+    """
+    Fixed size Bloom filter for `capacity` keys at `error_rate` false
+    positives, no false negatives.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, hashes: Hashes):
+        first, second = hashes
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, hashes: Hashes):
+        for position in self._positions(hashes):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+        self.count += 1
+
+    def __contains__(self, hashes: Hashes) -> bool:
+        bits = self.bits
+
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(hashes))
+
+
+class ScalableBloomFilter:
+    """
+    Bloom filter that grows with its keys: when the last filter is full
+    one twice as large with half the error rate is added, so memory
+    follows the number of keys and the overall error stays under
+    `error_rate` (Almeida et al.).
+    """
+
+    def __init__(self, error_rate: float, initial_capacity: int = 1024):
+        self.error_rate = error_rate
+        self.initial_capacity = initial_capacity
+        self.filters: List[BloomFilter] = []
+
+    def add(self, hashes: Hashes):
+        if not self.filters or self.filters[-1].count >= self.filters[-1].capacity:
+            self.filters.append(BloomFilter(
+                self.initial_capacity * 2 ** len(self.filters),
+                self.error_rate / 2 ** (len(self.filters) + 1)
+            ))
+
+        self.filters[-1].add(hashes)
+
+    def __contains__(self, hashes: Hashes) -> bool:
+        return any(hashes in bloom for bloom in self.filters)
+
+    @property
+    def count(self) -> int:
+        return sum(bloom.count for bloom in self.filters)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(bloom.bits) for bloom in self.filters)
@@ -0,0 +1,48 @@
+import base64
+import hashlib
+import hmac
+from typing import Any, List, Sequence
+
+import orjson
+from fastapi import HTTPException
+
+from ..conf import settings
+
+__all__ = ('encode_cursor', 'decode_cursor')
+
+_DIGEST_SIZE = 16
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(
+        settings.app_secret_key.encode(), payload, hashlib.sha256
+    ).digest()[:_DIGEST_SIZE]
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """
+    Opaque and signed cursor for keyset pagination, the values are
+    the sort key of the last row sent to the client.
+    """
+    payload = orjson.dumps(list(values))
+
+    return base64.urlsafe_b64encode(_sign(payload) + payload)\
+        .rstrip(b'=').decode()
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        digest, payload = raw[:_DIGEST_SIZE], raw[_DIGEST_SIZE:]
+
+        if not hmac.compare_digest(digest, _sign(payload)):
+            raise ValueError("Bad signature")
+
+        values = orjson.loads(payload)
+
+        if not isinstance(values, list):
+            raise ValueError("Bad payload")
+    except ValueError:
+        raise HTTPException(400, detail="Invalid cursor")
+
+    return values
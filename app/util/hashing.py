@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple, Union
+
+from ..conf import settings
+
+__all__ = ('PasswordHasher', 'password_hasher')
+
+
+def _pbkdf2(algorithm: str, passwd: bytes, salt: bytes, iterations: int) -> str:
+    return hashlib.pbkdf2_hmac(algorithm, passwd, salt, iterations).hex()
+
+
+def _encode(algorithm: str, iterations: int, salt: bytes, hashed: str) -> str:
+    return 'pbkdf2_%s$%d$%s$%s' % (algorithm, iterations, salt.decode(), hashed)
+
+
+class PasswordHasher:
+    """
+    Runs the KDF in a bounded executor so hashing never blocks the event
+    loop. `executor` is `thread` (hashlib releases the GIL), `process` or
+    `inline` to hash in the caller.
+
+    Hashes are stored as `pbkdf2_<algorithm>$<iterations>$<salt>$<hash>`
+    with a random salt per hash. `salt` is only used to verify the legacy
+    bare hex hashes, computed with the current algorithm and iterations.
+    """
+
+    def __init__(
+        self, algorithm: str, iterations: int, salt: Union[str, bytes],
+        workers: int = 4, executor: str = 'thread'
+    ):
+        if executor not in ('thread', 'process', 'inline'):
+            raise ValueError("Unrecognized executor %s" % executor)
+
+        self.algorithm = algorithm
+        self.iterations = iterations
+        self.salt = salt.encode() if isinstance(salt, str) else salt
+        self.workers = workers
+        self.executor_kind = executor
+
+        self._executor: Optional[Executor] = None
+        self._executor_pid: Optional[int] = None
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        if self.executor_kind == 'inline':
+            return None
+
+        if self._executor_pid != os.getpid():
+            executor_class = (
+                ProcessPoolExecutor if self.executor_kind == 'process'
+                else ThreadPoolExecutor
+            )
+            self._executor = executor_class(max_workers=self.workers)
+            self._executor_pid = os.getpid()
+
+        return self._executor
+
+    def _parse(self, hashed: Optional[str]) -> Optional[Tuple[str, int, bytes, str]]:
+        """
+        `(algorithm, iterations, salt, hash)` of a stored hash, None when
+        it isn't one.
+        """
+        if not hashed:
+            return None
+
+        if '$' not in hashed:
+            return self.algorithm, self.iterations, self.salt, hashed
+
+        try:
+            method, iterations, salt, hashed = hashed.split('$')
+            algorithm = method[len('pbkdf2_'):]
+
+            if not method.startswith('pbkdf2_') or algorithm not in hashlib.algorithms_available:
+                return None
+
+            return algorithm, int(iterations), salt.encode(), hashed
+        except ValueError:
+            return None
+
+    async def _kdf(self, algorithm: str, passwd: bytes, salt: bytes, iterations: int) -> str:
+        if self.executor is None:
+            return _pbkdf2(algorithm, passwd, salt, iterations)
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, _pbkdf2, algorithm, passwd, salt, iterations
+        )
+
+    def hash_sync(self, passwd: Union[str, bytes]) -> str:
+        if not isinstance(passwd, bytes):
+            passwd = passwd.encode()
+
+        salt = secrets.token_hex(16).encode()
+
+        return _encode(
+            self.algorithm, self.iterations, salt,
+            _pbkdf2(self.algorithm, passwd, salt, self.iterations)
+        )
+
+    async def hash(self, passwd: Union[str, bytes]) -> str:
+        if not isinstance(passwd, bytes):
+            passwd = passwd.encode()
+
+        salt = secrets.token_hex(16).encode()
+
+        return _encode(
+            self.algorithm, self.iterations, salt,
+            await self._kdf(self.algorithm, passwd, salt, self.iterations)
+        )
+
+    async def verify(self, passwd: Union[str, bytes], hashed: Optional[str]) -> bool:
+        """
+        Constant-time comparison, an unknown `hashed` still pays the KDF
+        so the timing doesn't tell whether the user exists.
+        """
+        if not isinstance(passwd, bytes):
+            passwd = passwd.encode()
+
+        parsed = self._parse(hashed)
+        algorithm, iterations, salt, expected = parsed or (
+            self.algorithm, self.iterations, self.salt, ''
+        )
+        computed = await self._kdf(algorithm, passwd, salt, iterations)
+
+        return hmac.compare_digest(computed, expected) and parsed is not None
+
+    def needs_rehash(self, hashed: Optional[str]) -> bool:
+        """
+        Whether `hashed` is legacy or was computed with other parameters
+        than the current ones.
+        """
+        parsed = self._parse(hashed)
+
+        return parsed is None or '$' not in hashed or parsed[:2] != (self.algorithm, self.iterations)
+
+    def shutdown(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    settings.password_hash_algorithm,
+    settings.password_hash_iterations,
+    settings.app_secret_key,
+    workers=settings.password_hash_workers,
+    executor=settings.password_hash_executor
+)
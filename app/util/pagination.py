@@ -0,0 +1,105 @@
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException, Request
+from sqlalchemy import and_, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import Select
+
+from .. import models
+from ..cache import count_cache
+from .cursor import encode_cursor, decode_cursor
+
+__all__ = ('keyset_order', 'keyset_after', 'keyset_paginate')
+
+
+def keyset_order(columns: Sequence[Any]) -> List[Any]:
+    """
+    Ascending order of `columns` with NULLs first, the order that
+    `keyset_after` compares in. Postgres puts NULLs last by default, so
+    indexes on nullable sort columns declare `NULLS FIRST` there.
+    """
+    return [
+        column.asc().nulls_first() if column.expression.nullable else column.asc()
+        for column in columns
+    ]
+
+
+def keyset_after(columns: Sequence[Any], values: Sequence[Any]):
+    """
+    Rows after `values` in `keyset_order(columns)`, nullable columns
+    included, bounded by the first column so it stays an index range.
+    """
+    after = []
+    equal = []
+
+    for column, value in zip(columns, values):
+        if value is None:
+            after.append(and_(*equal, column.isnot(None)))
+            equal.append(column.is_(None))
+        else:
+            after.append(and_(*equal, column > value))
+            equal.append(column == value)
+
+    where = or_(*after)
+
+    if values[0] is not None:
+        where = (columns[0] >= values[0]) & where
+
+    return where
+
+
+async def estimated_count(db: AsyncSession, scope: str, query: Select) -> int:
+    """
+    Count of `query` cached for `list_count_cache_ttl` seconds.
+    """
+    total = await count_cache.get(scope)
+
+    if total is None:
+        total = (
+            await db.execute(
+                select(func.count()).select_from(query.order_by(None).subquery())
+            )
+        )\
+            .scalar_one()
+        await count_cache.set(scope, total)
+
+    return total
+
+
+async def keyset_paginate(
+    db: AsyncSession, request: Request, query: Select,
+    columns: Sequence[Any], scope: str,
+    cursor: Optional[str], size: int, total: bool = False
+):
+    """
+    Page of `query` ordered by `columns`, the last one must be unique.
+    The cursor carries `scope` so it isn't valid on other listings.
+    """
+    paged = query.order_by(*keyset_order(columns))
+
+    if cursor:
+        values = decode_cursor(cursor)
+
+        if len(values) != len(columns) + 1 or values[0] != scope:
+            raise HTTPException(400, detail="Invalid cursor")
+
+        paged = paged.where(keyset_after(columns, values[1:]))
+
+    items = (await db.execute(paged.limit(size + 1))).scalars().all()
+    next_cursor = None
+
+    if len(items) > size:
+        items = items[:size]
+        next_cursor = encode_cursor(
+            [scope] + [getattr(items[-1], column.key) for column in columns]
+        )
+
+    return models.CursorPage(
+        items=items, size=size, cursor=next_cursor,
+        total=(await estimated_count(db, scope, query)) if total else None,
+        next=(
+            str(request.url.include_query_params(cursor=next_cursor))
+            if next_cursor else None
+        )
+    )
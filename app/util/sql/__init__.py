@@ -1,23 +1,115 @@
-from typing import Any, Type, Sequence
-
-from fastapi import HTTPException
+import base64
+import hashlib
+import hmac
+import time
+from typing import Any, Callable, Optional, Type
+
+import orjson
+from fastapi import HTTPException, Request, Response
 from pydantic import BaseModel
-from sqlalchemy.engine import Row
+from sqlalchemy import insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import sessionmaker
 from sqlmodel import SQLModel
 
-from ...sql import engine
+from ...conf import settings
+from ...sql import get_engine, get_sessionmaker, read_session
+
+__all__ = ('get_session', 'get_primary_session', 'get_engine', 'read_only')
+
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+LAST_WRITE_COOKIE = 'last_write'
+LAST_WRITE_HEADER = 'X-Last-Write'
+
+
+def read_only(fn: Callable) -> Callable:
+    """
+    Marks a route that only reads, for `get_session` to send it to a
+    replica whatever its method, e.g. a search by `POST`.
+    """
+    fn.__read_only__ = True
+    return fn
+
+
+def _subject(request: Request) -> Optional[str]:
+    """
+    Unverified `sub` of the bearer token. It only picks the database,
+    the routes verify the token.
+    """
+    try:
+        payload = request.headers.get('authorization', '').split('.')[1]
+        claims = orjson.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return str(claims['sub'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _last_write_signature(subject: str, until: int) -> str:
+    return hmac.new(
+        settings.app_secret_key.encode(), ('%s:%d' % (subject, until)).encode(), hashlib.sha256
+    ).hexdigest()[:32]
+
+
+def _last_write(subject: str) -> str:
+    """
+    Signed end of the read-your-writes window of `subject`, valid for
+    that user only.
+    """
+    until = int(time.time() + settings.database_read_your_writes_seconds) + 1
+    return '%d.%s' % (until, _last_write_signature(subject, until))
 
-__all__ = ('get_session', 'engine')
 
+def _wrote_recently(request: Request, subject: str) -> bool:
+    value = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
 
-async def get_session() -> AsyncSession:
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
+    try:
+        until, signature = value.split('.')
+        until = int(until)
+    except (AttributeError, ValueError):
+        return False
+
+    return until > time.time() and hmac.compare_digest(
+        signature, _last_write_signature(subject, until)
     )
-    async with async_session() as session:
+
+
+async def get_primary_session() -> AsyncSession:
+    """
+    Session on the primary, for reads that must see the latest writes.
+    """
+    async with get_sessionmaker()() as session:
+        yield session
+
+
+async def get_session(request: Request, response: Response) -> AsyncSession:
+    """
+    Session on a replica for `GET`/`HEAD` and `read_only` routes, on the
+    primary for the rest. With no healthy replica everything goes to
+    the primary.
+
+    A user reads from the primary for `database_read_your_writes_seconds`
+    after their own writes. The window travels with the client, as a
+    cookie and an `X-Last-Write` header to send back, so every worker
+    sees it and it outlives the access token.
+    """
+    subject = _subject(request)
+    reads = getattr(request.scope.get('endpoint'), '__read_only__', request.method in SAFE_METHODS)
+
+    if reads and not (subject and _wrote_recently(request, subject)):
+        async with read_session() as session:
+            yield session
+
+        return
+
+    if not reads and subject:
+        value = _last_write(subject)
+        response.headers[LAST_WRITE_HEADER] = value
+        response.set_cookie(
+            LAST_WRITE_COOKIE, value, httponly=True, samesite='lax',
+            max_age=int(settings.database_read_your_writes_seconds) + 1
+        )
+
+    async with get_sessionmaker()() as session:
         yield session
 
 
@@ -27,6 +119,7 @@ async def get_or_404(db: AsyncSession, model: Type[SQLModel], where: Any) -> SQL
             select(model).where(where)
         )
     )\
+        .scalars()\
         .first()
 
     if not instance:
@@ -35,28 +128,21 @@ async def get_or_404(db: AsyncSession, model: Type[SQLModel], where: Any) -> SQL
     return instance
 
 
-async def roles_or_403(db: AsyncSession, roles: Sequence[str], where):
-    from ...models.db import User
-
-    user: Row = (
+async def create(db, model: Type[BaseModel], sql_model: Type[SQLModel]):
+    """
+    Inserts `model` and returns the row as stored, in one statement.
+    """
+    db_row = (
         await db.execute(
-            select(User.role).where(where)
+            insert(sql_model)
+                .values(**model.dict(skip_defaults=True))
+                .returning(sql_model)
         )
     )\
-        .first()
-
-    if user is None or user.role in roles:
-        raise HTTPException(status_code=403, detail="Forbidden")
-
-    return True
-
-
-async def create(db, model: Type[BaseModel], sql_model: Type[SQLModel]):
-    db_row = sql_model(**model.dict(skip_defaults=True))
-    db.add(db_row)
+        .scalars()\
+        .one()
 
     await db.commit()
-    await db.update(db_row)
 
     return db_row
 
@@ -64,21 +150,38 @@ async def create(db, model: Type[BaseModel], sql_model: Type[SQLModel]):
 async def partial_update(
     db: AsyncSession, model: Type[BaseModel], sql_model: Type[SQLModel], where: Any
 ):
-    db_row = (
-        await db.execute(
-            select(sql_model).where(where)
-        )
-    )\
-        .first()
+    """
+    Sets only the fields given in `model` on the row matching `where`
+    with a single `UPDATE ... RETURNING`, 404 when no row matched.
+    """
+    values = model.dict(skip_defaults=True)
 
-    if not db_row:
-        raise HTTPException(404)
+    if not values:
+        return await get_or_404(db, sql_model, where)
+
+    statement = update(sql_model).where(where).values(**values)
+
+    if db.get_bind().dialect.update_returning:
+        db_row = (
+            await db.execute(
+                statement.returning(sql_model)
+                    .execution_options(synchronize_session='fetch')
+            )
+        )\
+            .scalars()\
+            .first()
 
-    for prop, value in model.dict(skip_defaults=True).items():
-        setattr(db_row, prop, value)
+        if db_row is None:
+            raise HTTPException(404)
+
+        await db.commit()
+
+        return db_row
+
+    # Without RETURNING the row is read back after the update
+    if not (await db.execute(statement)).rowcount:
+        raise HTTPException(404)
 
-    await db.add(db_row)
     await db.commit()
-    await db.update(db_row)
 
-    return db_row
+    return await get_or_404(db, sql_model, where)
@@ -0,0 +1,94 @@
+import os
+import re
+import threading
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from . import strip_tags
+
+__all__ = ('Template', 'TemplateRegistry')
+
+# Plain text must not be HTML escaped, `{{name}}` becomes `{{&name}}`
+_ESCAPED_TAG = re.compile(r'{{(?![{#^/!>&=])\s*([^}]+?)\s*}}')
+
+
+def _tokens(source: str) -> List[Tuple[str, str]]:
+    # Imported on first use, it isn't needed to start the app
+    from chevron.tokenizer import tokenize
+
+    return list(tokenize(source))
+
+
+class Template:
+    """
+    Template tokenized once, along with the tokens of its plain-text
+    skeleton so the HTML to text step runs at load time only.
+    """
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.load()
+
+    def load(self):
+        import chevron
+
+        with open(self.path, "r") as template:
+            source = template.read()
+
+        self.mtime = os.stat(self.path).st_mtime
+        self.html_tokens = _tokens(source)
+
+        try:
+            self.text_tokens: Optional[List[Tuple[str, str]]] = _tokens(
+                _ESCAPED_TAG.sub(r'{{&\1}}', strip_tags(source))
+            )
+        except chevron.ChevronError:
+            # Sections split by tags, the text is derived per render
+            self.text_tokens = None
+
+    def render(self, data: Mapping[str, Any]) -> Tuple[str, str]:
+        import chevron
+
+        html = chevron.render(self.html_tokens, data)
+
+        if self.text_tokens is None:
+            return html, strip_tags(html)
+
+        return html, chevron.render(self.text_tokens, data)
+
+
+class TemplateRegistry:
+    def __init__(self, root: str, extension: str = '.html', hot_reload: bool = False):
+        self.root = root
+        self.extension = extension
+        self.hot_reload = hot_reload
+        self._templates: Dict[str, Template] = {}
+        self._lock = threading.Lock()
+
+    def load_all(self):
+        for name in os.listdir(self.root):
+            if name.endswith(self.extension):
+                self.get(name[:-len(self.extension)])
+
+    def get(self, name: str) -> Template:
+        template = self._templates.get(name)
+
+        if template is None:
+            with self._lock:
+                template = self._templates.get(name)
+
+                if template is None:
+                    template = self._templates[name] = Template(
+                        name, os.path.join(self.root, name + self.extension)
+                    )
+        elif self.hot_reload and os.stat(template.path).st_mtime != template.mtime:
+            with self._lock:
+                template.load()
+
+        return template
+
+    def render(self, name: str, data: Mapping[str, Any]) -> Tuple[str, str]:
+        """
+        Rendered HTML and plain text of the template `name`.
+        """
+        return self.get(name).render(data)
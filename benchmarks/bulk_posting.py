@@ -0,0 +1,129 @@
+"""
+Bulk posting against the same postings sent as single requests.
+
+`--postings` deposits and withdrawals spread over `--accounts` accounts
+owned by the user are posted once as single deposit/withdraw requests
+and once as a `POST /accounts/transactions/bulk` call, then the account
+amounts are checked against the ledger.
+
+    python -m benchmarks.bulk_posting --postings 2000 --accounts 50
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from .common import setup_environment, create_schema, asgi_client, seed_user
+
+
+async def run(postings: int, accounts: int, mode: str):
+    from sqlalchemy import func
+    from sqlalchemy.future import select
+
+    from app import app, models
+    from app.sql import get_engine, get_sessionmaker, dispose
+
+    await create_schema(get_engine())
+
+    async with get_sessionmaker()() as db:
+        user = await seed_user(db, "11111111-1", "bulk-password")
+
+        for i in range(accounts):
+            db.add(models.db.Account(
+                number="BULK-%d" % i, name="Bulk %d" % i, country="CL",
+                country_commercial_id="1-9", is_company=False, enabled=True,
+                current_amount=1000.0
+            ))
+        await db.flush()
+
+        for i in range(accounts):
+            db.add(models.db.UserAccounts(user_id=user.id, account_number="BULK-%d" % i))
+        await db.commit()
+
+    rnd = random.Random(0)
+    batch = [
+        dict(
+            account_number="BULK-%d" % rnd.randrange(accounts),
+            operation=rnd.choice(("deposit", "withdraw")),
+            amount=round(rnd.uniform(1, 20), 2),
+            note="bulk"
+        )
+        for _ in range(postings)
+    ]
+
+    async with asgi_client(app) as client:
+        response = await client.post(
+            "/api/v1/auth/login",
+            json={"username": "11111111-1", "password": "bulk-password"}
+        )
+        response.raise_for_status()
+        headers = {"Authorization": "Bearer %s" % response.json()["access_token"]}
+
+        started = time.perf_counter()
+        single_posted = 0
+
+        for posting in batch:
+            response = await client.post(
+                "/api/v1/accounts/%s/%s" % (posting["account_number"], posting["operation"]),
+                json=dict(
+                    name="Bulk", country_commercial_id="1-9",
+                    note=posting["note"], amount=posting["amount"]
+                ),
+                headers=headers
+            )
+            single_posted += response.status_code == 200
+
+        single_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        response = await client.post(
+            "/api/v1/accounts/transactions/bulk",
+            json=dict(mode=mode, postings=batch),
+            headers=headers
+        )
+        bulk_elapsed = time.perf_counter() - started
+        response.raise_for_status()
+        bulk_posted = response.json()["posted"]
+
+    async with get_sessionmaker()() as db:
+        Account = models.db.Account
+        AccountTransaction = models.db.AccountTransaction
+
+        current_amount = (
+            await db.execute(select(func.sum(Account.current_amount)))
+        ).scalar_one()
+        ledger_amount = (
+            await db.execute(select(func.sum(AccountTransaction.amount)))
+        ).scalar_one()
+
+    await dispose()
+
+    print("postings: %d, accounts: %d, mode: %s" % (postings, accounts, mode))
+    print("single requests  %8.3fs  %8.1f postings/s  (%d posted)" % (
+        single_elapsed, postings / single_elapsed, single_posted
+    ))
+    print("bulk request     %8.3fs  %8.1f postings/s  (%d posted)" % (
+        bulk_elapsed, postings / bulk_elapsed, bulk_posted
+    ))
+    print("speedup          %8.1fx" % (single_elapsed / bulk_elapsed))
+
+    expected = accounts * 1000.0 + (ledger_amount or 0.0)
+
+    if abs(current_amount - expected) > 1e-6:
+        raise SystemExit("Account amounts %.2f don't match the ledger %.2f" % (current_amount, expected))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--postings", type=int, default=2000)
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--mode", choices=("all_or_nothing", "best_effort"), default="best_effort")
+    args = parser.parse_args()
+
+    setup_environment("bulk_posting")
+
+    asyncio.run(run(args.postings, args.accounts, args.mode))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import os
+import statistics
+import tempfile
+from typing import Dict, Sequence
+
+
+def setup_environment(name: str) -> str:
+    """
+    Points the app settings to a fresh SQLite database, must be called
+    before importing `app`.
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "%s.db" % name)
+
+    os.environ.setdefault("APP_SECRET_KEY", "benchmark-secret-key")
+    os.environ["DATABASE_DEFAULT_URL"] = "sqlite+aiosqlite:///%s" % path
+
+    return path
+
+
+async def create_schema(engine):
+    from sqlmodel import SQLModel
+    from app import models  # noqa: F401, registers the tables
+
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+
+def asgi_client(app):
+    import httpx
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://benchmark"
+    )
+
+
+async def seed_user(
+    db, country_commercial_id: str, password: str, role: str = "user", **fields
+):
+    from app import models
+    from app.util.hashing import password_hasher
+
+    user = models.db.User(
+        first_company_name=fields.pop("first_company_name", "Bench"),
+        first_surname=fields.pop("first_surname", "Mark"),
+        is_company=False, country="CL",
+        country_commercial_id=country_commercial_id,
+        email=fields.pop("email", "bench@example.com"),
+        phone=fields.pop("phone", "+56 9 1234 5678"),
+        address=fields.pop("address", "Benchmark street 123"),
+        role=role,
+        password=await password_hasher.hash(password),
+        **fields
+    )
+    db.add(user)
+    await db.commit()
+
+    return user
+
+
+def latency_summary(samples: Sequence[float]) -> Dict[str, float]:
+    """
+    p50/p95/p99 and mean in milliseconds of `samples` in seconds.
+    """
+    ordered = sorted(samples)
+    quantiles = statistics.quantiles(ordered, n=100) if len(ordered) > 1 else ordered * 99
+
+    return dict(
+        mean=statistics.fmean(ordered) * 1000,
+        p50=quantiles[49] * 1000,
+        p95=quantiles[94] * 1000,
+        p99=quantiles[98] * 1000,
+    )
@@ -0,0 +1,99 @@
+"""
+Per-request cost of the CORS middleware.
+
+A trivial ASGI app is called directly, bare, behind `CORSMiddleware` and
+behind Starlette's middleware with a forced `Origin` (the previous
+`CORSOnAllMiddleware`), for requests without an `Origin`, cross-origin
+requests and preflights.
+
+    python -m benchmarks.cors_overhead --requests 200000
+"""
+import argparse
+import asyncio
+import time
+
+from .common import setup_environment
+
+OPTIONS = dict(allow_origins=['*'], allow_credentials=True, allow_methods=['*'], allow_headers=['*'])
+
+REQUESTS = {
+    "no origin": dict(method='GET', headers=[(b'host', b'api.example.com')]),
+    "cross-origin": dict(method='GET', headers=[
+        (b'host', b'api.example.com'), (b'origin', b'https://app.example.com')
+    ]),
+    "preflight": dict(method='OPTIONS', headers=[
+        (b'host', b'api.example.com'), (b'origin', b'https://app.example.com'),
+        (b'access-control-request-method', b'POST'),
+        (b'access-control-request-headers', b'authorization, content-type'),
+    ]),
+}
+
+
+async def endpoint(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-length', b'0')]})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def forced_origin(app):
+    from starlette.middleware.cors import CORSMiddleware
+
+    class CORSOnAllMiddleware(CORSMiddleware):
+        async def __call__(self, scope, receive, send) -> None:
+            scope['headers'].append((b'origin', b'allow'))
+            return await super().__call__(scope, receive, send)
+
+    return CORSOnAllMiddleware(app, **OPTIONS)
+
+
+async def measure(app, request, requests: int) -> float:
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+
+    for _ in range(requests):
+        scope = {
+            'type': 'http', 'scheme': 'https', 'path': '/',
+            'method': request['method'], 'headers': list(request['headers'])
+        }
+        await app(scope, receive, send)
+
+    return (time.perf_counter() - started) / requests
+
+
+async def run(requests: int):
+    from app.middleware import CORSMiddleware
+
+    apps = {
+        "bare": endpoint,
+        "CORSMiddleware": CORSMiddleware(endpoint, max_age=7200, **OPTIONS),
+        "forced origin (previous)": forced_origin(endpoint),
+    }
+
+    for name, request in REQUESTS.items():
+        print(name)
+        bare = None
+
+        for label, app in apps.items():
+            elapsed = await measure(app, request, requests)
+            bare = elapsed if bare is None else bare
+            print("  %-26s %8.2fus/request  overhead %8.2fus" % (
+                label, elapsed * 1e6, (elapsed - bare) * 1e6
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+
+    setup_environment("cors_overhead")
+
+    asyncio.run(run(args.requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Import time budget and startup breakdown of the app.
+
+`python -X importtime` imports the app in fresh interpreters, the best
+run is reported by top-level package. It exits with an error when the
+import takes longer than `--budget` milliseconds or imports a module
+that must stay lazy. Then the startup handlers are run and timed.
+
+The routers, and the models they import, stay eager and are reported
+apart. The routes must be registered before the app serves a request,
+and a cold instance's first request is the one waiting for the import.
+Deferring them would move their cost into that request, not remove it.
+
+    python -m benchmarks.import_budget --budget 1000
+"""
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from .common import setup_environment, create_schema
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+LAZY_MODULES = ('chevron', 'emails')
+
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """
+    `(module, self, cumulative)` microseconds of each imported module.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+        cwd=root, env=os.environ, capture_output=True, text=True
+    )
+
+    if completed.returncode:
+        raise SystemExit(completed.stderr)
+
+    return [
+        (match.group(4), int(match.group(1)), int(match.group(2)))
+        for match in map(IMPORT_LINE.match, completed.stderr.splitlines())
+        if match
+    ]
+
+
+async def startup_breakdown() -> Dict[str, float]:
+    from app import app
+    from app.sql import get_engine
+    from app.startup import timed_startup
+
+    # The revocation list is loaded at startup
+    await create_schema(get_engine())
+
+    try:
+        return await timed_startup(app)
+    finally:
+        await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget", type=float, default=1000.0, help="Milliseconds")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    setup_environment("import_budget")
+    os.environ.setdefault("MAIL_OUTBOX_WORKER", "false")
+
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+    best = min(runs, key=lambda times: dict((m, c) for m, _, c in times)[args.module])
+    total = dict((module, cumulative) for module, _, cumulative in best)[args.module] / 1000
+
+    packages: Dict[str, int] = {}
+
+    for module, self_time, _ in best:
+        package = module.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_time
+
+    print("import %s: %.1fms (best of %d)" % (args.module, total, args.repeat))
+
+    for package, self_time in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print("  %-24s %8.1fms" % (package, self_time / 1000))
+
+    routers = dict((module, cumulative) for module, _, cumulative in best).get('app.routers')
+
+    if routers is not None:
+        print("  %-24s %8.1fms (eager, included above)" % ("app.routers", routers / 1000))
+
+    breakdown = asyncio.run(startup_breakdown())
+    print("startup: %.1fms" % (sum(breakdown.values()) * 1000))
+
+    for name, elapsed in breakdown.items():
+        print("  %-56s %8.1fms" % (name, elapsed * 1000))
+
+    failures = []
+
+    if total > args.budget:
+        failures.append("import took %.1fms, budget %.1fms" % (total, args.budget))
+
+    imported = {module for module, _, _ in best}
+    failures.extend(
+        "%s is imported eagerly" % module for module in LAZY_MODULES if module in imported
+    )
+
+    if failures:
+        print("\nOver budget:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
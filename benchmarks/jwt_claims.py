@@ -0,0 +1,119 @@
+"""
+Per-request auth overhead with and without the claims cache.
+
+`uncached` is what routes did before: `AuthJWT.jwt_required()` then the
+subject and role read from the token, each one verifying it again.
+`cached` goes through the `jwt_required` dependency and its cache.
+`GET /users/me` is also timed end to end with the cache on and off.
+
+    python -m benchmarks.jwt_claims --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from .common import setup_environment, create_schema, asgi_client, seed_user, latency_summary
+
+USERNAME = "11111111-1"
+PASSWORD = "jwt-password"
+
+
+def request_with(authorization: str):
+    from starlette.requests import Request
+
+    return Request({
+        'type': 'http', 'method': 'GET', 'path': '/',
+        'headers': [(b'authorization', authorization.encode())]
+    })
+
+
+async def per_request(authorization: str, requests: int):
+    from fastapi_jwt_auth import AuthJWT
+
+    from app.auth import jwt_required
+    from app.authorization import jwt_role
+    from app.cache import claims_cache
+    from app.sql import get_sessionmaker
+
+    request = request_with(authorization)
+    db = get_sessionmaker()()
+
+    async def uncached():
+        auth = AuthJWT(request)
+        auth.jwt_required()
+        return auth.get_jwt_subject(), auth.get_raw_jwt().get('role')
+
+    async def cached():
+        claims = await jwt_required(AuthJWT(request), authorization, db)
+        return claims.get_jwt_subject(), jwt_role(claims)
+
+    assert await uncached() == await cached()
+
+    for name, check in (("uncached", uncached), ("cached", cached)):
+        started = time.perf_counter()
+
+        for _ in range(requests):
+            await check()
+
+        print("%-10s %8.2fus/request" % (name, (time.perf_counter() - started) / requests * 1e6))
+
+    await db.close()
+    print("claims cache: %s" % claims_cache.stats())
+
+
+async def end_to_end(client, authorization: str, requests: int):
+    from app.cache import claims_cache
+
+    maxsize = claims_cache.maxsize
+
+    for name, size in (("cache off", 0), ("cache on", maxsize)):
+        claims_cache.maxsize = size
+        samples = []
+
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = await client.get("/api/v1/users/me", headers={"Authorization": authorization})
+            samples.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+        summary = latency_summary(samples)
+        print("GET /users/me %-10s p50 %6.2fms  p95 %6.2fms" % (name, summary["p50"], summary["p95"]))
+
+    claims_cache.maxsize = maxsize
+
+
+async def run(args):
+    from app import app
+    from app.sql import get_engine, get_sessionmaker, dispose
+
+    await create_schema(get_engine())
+
+    async with get_sessionmaker()() as db:
+        await seed_user(db, USERNAME, PASSWORD, role="admin")
+
+    try:
+        async with asgi_client(app) as client:
+            response = await client.post(
+                "/api/v1/auth/login", json={"username": USERNAME, "password": PASSWORD}
+            )
+            response.raise_for_status()
+            authorization = "Bearer %s" % response.json()["access_token"]
+
+            await per_request(authorization, args.requests)
+            await end_to_end(client, authorization, args.http_requests)
+    finally:
+        await dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--http-requests", type=int, default=500)
+    args = parser.parse_args()
+
+    setup_environment("jwt_claims")
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
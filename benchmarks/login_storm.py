@@ -0,0 +1,111 @@
+"""
+Latency of an unrelated endpoint while a login storm is running.
+
+The probe endpoint is measured alone and then while `--concurrency`
+clients log in continuously, run it once per `--executor` to compare
+hashing inline in the event loop against the executor pool.
+
+    python -m benchmarks.login_storm --executor inline
+    python -m benchmarks.login_storm --executor thread
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from .common import setup_environment, create_schema, asgi_client, seed_user, latency_summary
+
+PROBE_PATH = "/api/v1/specs/openapi.json"
+
+
+async def probe(client, requests: int, interval: float = 0.01):
+    """
+    Open-loop probe, each request is due at a fixed schedule and its
+    latency counts from that time, so time spent waiting for a blocked
+    event loop is measured too.
+    """
+    samples = []
+    started = time.perf_counter()
+
+    for i in range(requests):
+        due = started + i * interval
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+
+        response = await client.get(PROBE_PATH)
+        samples.append(time.perf_counter() - due)
+        response.raise_for_status()
+
+    return samples
+
+
+async def run(concurrency: int, requests: int):
+    from app import app
+    from app.sql import get_engine, get_sessionmaker, dispose
+
+    await create_schema(get_engine())
+
+    async with get_sessionmaker()() as db:
+        await seed_user(db, "11111111-1", "storm-password")
+
+    async with asgi_client(app) as client:
+        await client.get(PROBE_PATH)
+        idle = await probe(client, requests)
+
+        stop = asyncio.Event()
+        logins = 0
+
+        async def storm():
+            nonlocal logins
+
+            while not stop.is_set():
+                response = await client.post(
+                    "/api/v1/auth/login",
+                    json={"username": "11111111-1", "password": "storm-password"}
+                )
+                response.raise_for_status()
+                logins += 1
+
+        storm_tasks = [asyncio.create_task(storm()) for _ in range(concurrency)]
+
+        while logins < concurrency:
+            await asyncio.sleep(0.01)
+
+        started, logins_before = time.perf_counter(), logins
+        loaded = await probe(client, requests)
+        elapsed = time.perf_counter() - started
+        logins -= logins_before
+        stop.set()
+        await asyncio.gather(*storm_tasks)
+
+    await dispose()
+
+    print("executor: %s, iterations: %s" % (
+        os.environ["PASSWORD_HASH_EXECUTOR"], os.environ["PASSWORD_HASH_ITERATIONS"]
+    ))
+
+    for name, samples in (("idle", idle), ("login storm", loaded)):
+        summary = latency_summary(samples)
+        print("%-12s p50 %8.2fms  p95 %8.2fms  p99 %8.2fms" % (
+            name, summary["p50"], summary["p95"], summary["p99"]
+        ))
+
+    print("logins:      %.1f/s" % (logins / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--executor", choices=("inline", "thread", "process"), default="thread")
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_environment("login_storm")
+    os.environ["PASSWORD_HASH_EXECUTOR"] = args.executor
+    os.environ["PASSWORD_HASH_ITERATIONS"] = str(args.iterations)
+
+    asyncio.run(run(args.concurrency, args.requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Mail outbox delivery checked against an offline SMTP sink.
+
+A plain asyncio SMTP server on localhost stands in for the relay. The
+script enqueues mails and runs `OutboxWorker` batches through the real
+`smtp_send_batch`: claims don't overlap, accepted mails are marked sent
+once, and when the sink refuses them they are retried with backoff
+until `max_attempts`. It exits with an error when a check fails.
+
+    python -m benchmarks.mail_outbox --mails 200
+"""
+import argparse
+import asyncio
+import email
+import os
+import sys
+import time
+
+from .common import setup_environment, create_schema
+
+BACKOFF = 30.0
+
+
+class SMTPSink:
+    """
+    Minimal SMTP server keeping the messages it accepts, or refusing
+    every recipient with a temporary error while `refuse` is set.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.refuse = False
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def reply(*lines: str):
+            writer.write("".join("%s\r\n" % line for line in lines).encode())
+            await writer.drain()
+
+        await reply("220 sink ESMTP")
+
+        while True:
+            line = await reader.readline()
+
+            if not line:
+                break
+
+            command = line.decode().strip().upper()
+
+            if command.startswith(("EHLO", "HELO")):
+                await reply("250-sink", "250 AUTH PLAIN")
+            elif command.startswith("AUTH"):
+                await reply("235 Authenticated")
+            elif command.startswith("RCPT") and self.refuse:
+                await reply("451 Try again later")
+            elif command == "DATA":
+                await reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+
+                while (line := await reader.readline()) not in (b".\r\n", b""):
+                    data.append(line)
+
+                self.messages.append(email.message_from_bytes(b"".join(data)))
+                await reply("250 Queued")
+            elif command == "QUIT":
+                await reply("221 Bye")
+                break
+            else:
+                await reply("250 OK")
+
+        writer.close()
+
+
+async def run(args, sink: SMTPSink) -> list:
+    from sqlalchemy import func, update
+    from sqlalchemy.future import select
+
+    from app import models
+    from app.mail import OutboxWorker, enqueue
+    from app.sql import get_engine, get_sessionmaker, dispose
+    from app.util import the_ts_now
+
+    MailOutbox = models.db.MailOutbox
+    failures = []
+
+    def check(name: str, passed: bool):
+        print("%-52s %s" % (name, "ok" if passed else "FAILED"))
+
+        if not passed:
+            failures.append(name)
+
+    async def statuses():
+        async with get_sessionmaker()() as db:
+            return dict(
+                (
+                    await db.execute(
+                        select(MailOutbox.status, func.count()).group_by(MailOutbox.status)
+                    )
+                )\
+                    .all()
+            )
+
+    async def drain(worker: OutboxWorker):
+        while await worker.process_batch():
+            pass
+
+    await create_schema(get_engine())
+
+    try:
+        async with get_sessionmaker()() as db:
+            for i in range(args.mails):
+                enqueue(db, "user%d@example.com" % i, "Mail %d" % i, "<p>Mail %d</p>" % i, "Mail %d" % i)
+
+            await db.commit()
+
+        worker = OutboxWorker(batch_size=args.batch_size, max_attempts=2, backoff=BACKOFF)
+
+        async with get_sessionmaker()() as first, get_sessionmaker()() as second:
+            claimed = await asyncio.gather(worker.claim(first), worker.claim(second))
+            first_ids = {mail.id for mail in claimed[0]}
+            second_ids = {mail.id for mail in claimed[1]}
+            check("concurrent claims don't overlap", bool(first_ids) and not first_ids & second_ids)
+
+            # Releases the leases of the claims above
+            await first.execute(
+                update(MailOutbox).values(claim=None, next_attempt=the_ts_now())
+            )
+            await first.commit()
+
+        started = time.perf_counter()
+        await drain(worker)
+        elapsed = time.perf_counter() - started
+
+        print("delivered   %8.1f mails/s, %d mails in batches of %d" % (
+            args.mails / elapsed, args.mails, args.batch_size
+        ))
+        check("every mail is sent", await statuses() == {"sent": args.mails})
+        check("the sink got each mail once", len(sink.messages) == args.mails)
+        check(
+            "recipients and subjects are kept",
+            {(message["To"], message["Subject"]) for message in sink.messages}
+            == {("user%d@example.com" % i, "Mail %d" % i) for i in range(args.mails)}
+        )
+
+        sink.refuse = True
+
+        async with get_sessionmaker()() as db:
+            mail = enqueue(db, "retry@example.com", "Retry", "<p>Retry</p>")
+            await db.commit()
+            mail_id = mail.id
+
+        enqueued = the_ts_now()
+        await drain(worker)
+
+        async with get_sessionmaker()() as db:
+            mail = await db.get(MailOutbox, mail_id)
+            check(
+                "a refused mail is retried later",
+                mail.status == "pending" and mail.attempts == 1 and mail.claim is None
+                and "451" in (mail.last_error or "")
+            )
+            check(
+                "the retry is delayed by the backoff",
+                enqueued + int(BACKOFF * 0.8) - 1 <= mail.next_attempt
+                <= the_ts_now() + int(BACKOFF * 1.2)
+            )
+
+        check("it isn't retried before that", await worker.process_batch() == 0)
+
+        async with get_sessionmaker()() as db:
+            # As if the backoff had elapsed
+            await db.execute(update(MailOutbox).values(next_attempt=the_ts_now()))
+            await db.commit()
+
+        await drain(worker)
+
+        async with get_sessionmaker()() as db:
+            mail = await db.get(MailOutbox, mail_id)
+            check("it fails after max_attempts", mail.status == "failed" and mail.attempts == 2)
+
+        check("refused mails don't reach the sink", len(sink.messages) == args.mails)
+    finally:
+        await dispose()
+
+    return failures
+
+
+async def main_async(args) -> list:
+    sink = SMTPSink()
+    server = await asyncio.start_server(sink.handle, "127.0.0.1", 0)
+    host, port = server.sockets[0].getsockname()[:2]
+
+    os.environ["MAIL_SMTP_HOST"] = host
+    os.environ["MAIL_SMTP_PORT"] = str(port)
+    os.environ["MAIL_SMTP_TLS"] = "false"
+    os.environ["MAIL_SMTP_TIMEOUT"] = "5"
+    os.environ["MAIL_FROM"] = "outbox@example.com"
+    os.environ["MAIL_OUTBOX_WORKER"] = "false"
+
+    async with server:
+        return await run(args, sink)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mails", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_environment("mail_outbox")
+
+    failures = asyncio.run(main_async(args))
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
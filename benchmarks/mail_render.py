@@ -0,0 +1,54 @@
+"""
+Micro-benchmark of the mail render path, reading and parsing the
+template per message against the precompiled template registry.
+
+    python -m benchmarks.mail_render --number 2000
+"""
+import argparse
+import os
+import timeit
+
+from .common import setup_environment
+
+DATA = {
+    'mail_static_base': 'https://static.example.com',
+    'first_name': 'Bench',
+    'last_name': 'Mark',
+    'set_password_link': 'https://example.com/password/0123456789abcdef',
+    'set_password_key': '0123456789abcdef',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--template", default="change-password")
+    args = parser.parse_args()
+
+    setup_environment("mail_render")
+
+    import chevron
+
+    from app.mail import mail_templates
+    from app.util import strip_tags
+
+    path = os.path.join(mail_templates.root, args.template + mail_templates.extension)
+
+    def per_message():
+        with open(path, "r") as template:
+            html = chevron.render(template, DATA)
+
+        return html, strip_tags(html)
+
+    def registry():
+        return mail_templates.render(args.template, DATA)
+
+    mail_templates.load_all()
+
+    for name, fn in (("per message", per_message), ("registry", registry)):
+        elapsed = min(timeit.repeat(fn, number=args.number, repeat=3))
+        print("%-12s %8.1f us/render" % (name, elapsed / args.number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Per-request cost of `MetricsMiddleware`.
+
+A trivial ASGI app is called directly, with and without the middleware
+around it, so only the middleware overhead is measured. Then worker
+processes write their snapshots in multiprocess mode and one of them is
+killed: the aggregated counters must not go down. It exits with an error
+when a check fails.
+
+    python -m benchmarks.metrics_overhead --requests 200000 --workers 3
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+
+from .common import setup_environment
+
+
+async def endpoint(scope, receive, send):
+    scope['endpoint'] = endpoint
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def measure(app, requests: int) -> float:
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+
+    for _ in range(requests):
+        await app({'type': 'http', 'method': 'GET', 'path': '/'}, receive, send)
+
+    return (time.perf_counter() - started) / requests
+
+
+async def run(requests: int):
+    from app.metrics import MetricsMiddleware, MetricsRegistry
+
+    registry = MetricsRegistry()
+    bare = await measure(endpoint, requests)
+    instrumented = await measure(MetricsMiddleware(endpoint, registry), requests)
+
+    print("bare          %8.2fus/request" % (bare * 1e6))
+    print("instrumented  %8.2fus/request" % (instrumented * 1e6))
+    print("overhead      %8.2fus/request" % ((instrumented - bare) * 1e6))
+
+
+def worker(directory: str, requests: int, ready):
+    from app.metrics import MetricsRegistry
+
+    registry = MetricsRegistry(multiprocess_dir=directory)
+
+    for _ in range(requests):
+        registry.observe('GET', '/', 200, 0.001)
+
+    # Stays in flight until the worker is killed
+    registry.active[0] = {'method': 'GET'}
+    registry.write_snapshot()
+    ready.set()
+    time.sleep(600)
+
+
+def check_dead_workers(workers: int, requests: int) -> list:
+    from app.metrics import MetricsRegistry
+
+    failures = []
+
+    def check(name: str, passed: bool):
+        print("%-52s %s" % (name, "ok" if passed else "FAILED"))
+
+        if not passed:
+            failures.append(name)
+
+    def totals():
+        families = {metric['name']: metric for metric in registry.read_snapshots()}
+        durations = families['http_request_duration_seconds']['samples']
+
+        return (
+            sum(families['http_requests_total']['samples'].values()),
+            sum(
+                value for key, value in durations.items()
+                if key.startswith('http_request_duration_seconds_count')
+            ),
+            sum(families.get('http_requests_in_flight', {}).get('samples', {}).values())
+        )
+
+    registry = MetricsRegistry(multiprocess_dir=tempfile.mkdtemp(prefix="metrics-"))
+    processes = []
+
+    for _ in range(workers):
+        ready = multiprocessing.Event()
+        process = multiprocessing.Process(
+            target=worker, args=(registry.multiprocess_dir, requests, ready), daemon=True
+        )
+        process.start()
+        ready.wait()
+        processes.append(process)
+
+    try:
+        before = totals()
+        os.kill(processes[0].pid, signal.SIGKILL)
+        processes[0].join()
+        after = totals()
+        again = totals()
+
+        check("the workers are aggregated", before == (workers * requests,) * 2 + (workers,))
+        check("counters are kept after a worker is killed", after[0] >= before[0])
+        check("histograms are kept after a worker is killed", after[1] >= before[1])
+        check("the gauges of the killed worker are dropped", after[2] == workers - 1)
+        check("the killed worker is folded once", again == after)
+    finally:
+        for process in processes[1:]:
+            process.kill()
+            process.join()
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--workers", type=int, default=3)
+    args = parser.parse_args()
+
+    setup_environment("metrics_overhead")
+
+    asyncio.run(run(args.requests))
+
+    if check_dead_workers(args.workers, 1000):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
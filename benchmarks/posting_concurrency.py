@@ -0,0 +1,103 @@
+"""
+Concurrency stress benchmark of `app.ledger.post_transaction`.
+
+Many asyncio tasks post deposits and withdrawals to a single account,
+then the final account amount is checked against the ledger.
+
+    python -m benchmarks.posting_concurrency --tasks 50 --postings 40
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from .common import setup_environment, create_schema
+
+
+async def run(tasks: int, postings: int, initial_amount: float, min_amount: float):
+    from fastapi import HTTPException
+    from sqlalchemy import func
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.future import select
+
+    from app import models
+    from app.conf import settings
+    from app.ledger import post_transaction
+
+    engine = create_async_engine(
+        settings.database_default_url, connect_args={"timeout": 60}
+    )
+    await create_schema(engine)
+
+    async with AsyncSession(engine) as db:
+        db.add(models.db.Account(
+            number="BENCH-1", name="Benchmark", country="CL",
+            country_commercial_id="1-9", is_company=False, enabled=True,
+            current_amount=initial_amount, min_amount=min_amount
+        ))
+        await db.commit()
+
+    accepted = rejected = 0
+
+    async def worker(seed: int):
+        nonlocal accepted, rejected
+        rnd = random.Random(seed)
+
+        for _ in range(postings):
+            amount = round(rnd.uniform(1, 100), 2) * rnd.choice((1, -1, -1))
+
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                try:
+                    await post_transaction(db, "BENCH-1", amount, description="bench")
+                    accepted += 1
+                except HTTPException as exc:
+                    if exc.status_code != 403:
+                        raise
+
+                    rejected += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(seed) for seed in range(tasks)))
+    elapsed = time.perf_counter() - started
+
+    async with AsyncSession(engine) as db:
+        current_amount = (
+            await db.execute(
+                select(models.db.Account.current_amount)
+                    .where(models.db.Account.number == "BENCH-1")
+            )
+        ).scalar_one()
+        ledger_amount, ledger_count = (
+            await db.execute(
+                select(
+                    func.coalesce(func.sum(models.db.AccountTransaction.amount), 0.0),
+                    func.count(models.db.AccountTransaction.id)
+                )
+            )
+        ).one()
+
+    await engine.dispose()
+
+    print("postings:     %d accepted, %d rejected" % (accepted, rejected))
+    print("throughput:   %.1f postings/s" % ((accepted + rejected) / elapsed))
+    print("final amount: %.2f (ledger %.2f)" % (current_amount, initial_amount + ledger_amount))
+
+    assert ledger_count == accepted, "Ledger rows don't match accepted postings"
+    assert abs(current_amount - (initial_amount + ledger_amount)) < 1e-6, "Lost update"
+    assert current_amount >= min_amount, "Account overdrawn"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--postings", type=int, default=40)
+    parser.add_argument("--initial-amount", type=float, default=1000.0)
+    parser.add_argument("--min-amount", type=float, default=0.0)
+    args = parser.parse_args()
+
+    setup_environment("posting")
+    asyncio.run(run(args.tasks, args.postings, args.initial_amount, args.min_amount))
+
+
+if __name__ == '__main__':
+    main()
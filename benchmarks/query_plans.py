@@ -0,0 +1,187 @@
+"""
+Query plan regression check of the hot query paths on SQLite.
+
+The schema is built by running the Alembic migrations, then each hot
+path runs through the app code while its statements are captured and
+explained with `EXPLAIN QUERY PLAN`. It exits with an error when a
+statement does a full table scan or sorts in a temporary b-tree.
+
+    python -m benchmarks.query_plans
+"""
+import asyncio
+import os
+import re
+import sys
+from typing import Callable, Dict, List, Tuple
+
+from .common import setup_environment, seed_user
+
+FULL_SCAN = re.compile(r'^SCAN (?!\(|subquery|CONSTANT ROW)(\w+)(?!.*USING)')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE')
+
+
+def migrate():
+    from alembic import command
+    from alembic.config import Config
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command.upgrade(Config(os.path.join(root, "alembic.ini")), "head")
+
+
+async def seed(db):
+    from app import models
+    from app.mail import enqueue
+
+    user = await seed_user(db, "11111111-1", "plan-password")
+
+    for number in ("PLAN-1", "PLAN-2"):
+        db.add(models.db.Account(
+            number=number, name="Plan %s" % number, country="CL",
+            country_commercial_id="1-9", is_company=False, enabled=True,
+            current_amount=100.0
+        ))
+    await db.flush()
+
+    db.add(models.db.UserAccounts(user_id=user.id, account_number="PLAN-1"))
+
+    for i in range(20):
+        db.add(models.db.AccountTransaction(
+            account_number="PLAN-1", date=1000 + i, description="plan", amount=10.0
+        ))
+
+    db.add(models.db.UserPasswordChange(user_id=user.id))
+    enqueue(db, "plan@example.com", "Plan", "<p>plan</p>")
+
+    await db.commit()
+
+    return user
+
+
+def hot_paths(user) -> Dict[str, Callable]:
+    from fastapi import HTTPException
+    from sqlalchemy.future import select
+
+    from app import models
+    from app.authorization import owned_accounts, resolve_account_access
+    from app.ledger import balance_at, post_transaction, running_balance_query
+    from app.mail import OutboxWorker
+    from app.routers.users import password_change_or_404, password_requests_since
+    from app.util.pagination import keyset_after, keyset_order
+
+    User = models.db.User
+    Account = models.db.Account
+    user_sort_key = (
+        User.first_surname, User.last_surname,
+        User.first_company_name, User.following_names, User.id
+    )
+    account_sort_key = (Account.name, Account.number)
+
+    async def balance_page(db):
+        await db.execute(
+            running_balance_query("PLAN-1", 0.0, 1000, 2000, (1005, 6)).limit(51)
+        )
+
+    async def password_change_key(db):
+        try:
+            await password_change_or_404(db, "key")
+        except HTTPException:
+            pass
+
+    return {
+        "balance page": balance_page,
+        "balance at": lambda db: balance_at(db, "PLAN-1", 1010),
+        "posting": lambda db: post_transaction(db, "PLAN-1", -1.0, description="plan"),
+        "account access": lambda db: resolve_account_access(db, user.id, "PLAN-1"),
+        "owned accounts": lambda db: owned_accounts(db, user.id, ["PLAN-1", "PLAN-2"]),
+        "password requests": lambda db: password_requests_since(db, user.id, 0),
+        "password change key": password_change_key,
+        "users page": lambda db: db.execute(
+            select(User).order_by(*keyset_order(user_sort_key[:-1])).limit(50)
+        ),
+        "accounts page": lambda db: db.execute(
+            select(models.db.Account).order_by(models.db.Account.name).limit(50)
+        ),
+        "users cursor page": lambda db: db.execute(
+            select(User)
+                .where(keyset_after(user_sort_key, ("Mark", None, "Bench", None, 0)))
+                .order_by(*keyset_order(user_sort_key))
+                .limit(51)
+        ),
+        "accounts cursor page": lambda db: db.execute(
+            select(Account)
+                .where(keyset_after(account_sort_key, ("Plan", "PLAN-0")))
+                .order_by(*keyset_order(account_sort_key))
+                .limit(51)
+        ),
+        "mail outbox claim": lambda db: OutboxWorker(send=lambda mails: []).claim(db),
+    }
+
+
+async def run() -> List[str]:
+    from sqlalchemy import event
+
+    from app.sql import get_engine, dispose
+
+    engine = get_engine()
+    captured: List[Tuple[str, tuple]] = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            captured.append((statement, parameters))
+
+    try:
+        return await explain_hot_paths(engine, captured)
+    finally:
+        await dispose()
+
+
+async def explain_hot_paths(engine, captured: List[Tuple[str, tuple]]) -> List[str]:
+    from app.sql import get_sessionmaker
+
+    async with get_sessionmaker()() as db:
+        user = await seed(db)
+
+    failures = []
+
+    for name, path in hot_paths(user).items():
+        captured.clear()
+
+        async with get_sessionmaker()() as db:
+            await path(db)
+
+        statements = list(captured)
+
+        async with engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = [
+                    row[-1] for row in (
+                        await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+                    )
+                ]
+                bad = [
+                    detail for detail in plan
+                    if FULL_SCAN.search(detail) or TEMP_SORT.search(detail)
+                ]
+                status = "FAIL" if bad else "ok"
+                print("%-4s %-20s %s" % (status, name, " | ".join(plan)))
+
+                if bad:
+                    failures.append("%s: %s" % (name, ", ".join(bad)))
+
+    return failures
+
+
+def main():
+    setup_environment("query_plans")
+    migrate()
+
+    failures = asyncio.run(run())
+
+    if failures:
+        print("\nQuery plan regressions:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
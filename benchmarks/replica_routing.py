@@ -0,0 +1,180 @@
+"""
+Read replica routing checked against two SQLite files.
+
+The replica is a copy of the primary taken after seeding, so it never
+sees later writes, like a replica lagging forever. The script checks
+that reads go to the replica, writes and the user's reads right after
+them to the primary, that replica reads don't fill the balance cache
+and that a failing replica is ejected. It exits with an error when a
+check fails.
+
+The read-your-writes window is carried by the client, so a second
+client sending only the `X-Last-Write` header stands in for a request
+landing on another worker.
+
+    python -m benchmarks.replica_routing
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import time
+
+from .common import setup_environment, create_schema, asgi_client, seed_user
+
+PASSWORD = "replica-password"
+
+
+async def run(args, replica_path: str) -> list:
+    from sqlalchemy.exc import OperationalError
+
+    from app import app, models
+    from app.cache import balance_cache
+    from app.ledger import cached_account
+    from app.sql import get_engine, get_replica, get_sessionmaker, dispose, replica_stats
+
+    await create_schema(get_engine())
+
+    async with get_sessionmaker()() as db:
+        user = await seed_user(db, "1-9", PASSWORD, role="admin", email="before@example.com")
+        await seed_user(
+            db, "2-7", PASSWORD, role="admin", email="other@example.com", country_personal_id="2-7"
+        )
+        db.add(models.db.Account(
+            number="REPLICA-1", manager_user=user.id, name="Replica", country="CL",
+            country_commercial_id="1-9", is_company=False, enabled=True
+        ))
+        await db.commit()
+
+    shutil.copy(get_engine().url.database, replica_path)
+    failures = []
+
+    def check(name: str, passed: bool):
+        print("%-52s %s" % (name, "ok" if passed else "FAILED"))
+
+        if not passed:
+            failures.append(name)
+
+    async def login(client, username: str) -> dict:
+        response = await client.post(
+            "/api/v1/auth/login", json={"username": username, "password": PASSWORD}
+        )
+        response.raise_for_status()
+        return {"Authorization": "Bearer %s" % response.json()["access_token"]}
+
+    async def email(client, headers: dict) -> str:
+        return (await client.get("/api/v1/users/me", headers=headers)).json()["email"]
+
+    try:
+        async with asgi_client(app) as client, asgi_client(app) as elsewhere:
+            bearer = await login(client, "1-9")
+
+            response = await client.patch(
+                "/api/v1/users/me", json={"email": "after@example.com"}, headers=bearer
+            )
+            response.raise_for_status()
+            last_write = response.headers.get("X-Last-Write", "")
+
+            check(
+                "read right after own write is on the primary",
+                await email(client, bearer) == "after@example.com"
+            )
+            check(
+                "on another worker too",
+                await email(elsewhere, dict(bearer, **{"X-Last-Write": last_write})) == "after@example.com"
+            )
+            check(
+                "and with a new token of the same user",
+                await email(client, await login(elsewhere, "1-9")) == "after@example.com"
+            )
+            check(
+                "other users still read from the replica",
+                await email(client, await login(elsewhere, "2-7")) == "other@example.com"
+                and await email(
+                    elsewhere, dict(await login(elsewhere, "2-7"), **{"X-Last-Write": last_write})
+                ) == "other@example.com"
+            )
+
+            until, _, signature = last_write.partition(".")
+            forged = "%d.%s" % (int(until) + 3600, signature)
+            check(
+                "a forged window is ignored",
+                await email(elsewhere, dict(bearer, **{"X-Last-Write": forged})) == "before@example.com"
+            )
+
+            other = await login(elsewhere, "2-7")
+            (await elsewhere.post("/api/v1/auth/logout", headers=other)).raise_for_status()
+            check(
+                "a token revoked on the primary is refused on a read",
+                (await client.get("/api/v1/users/me", headers=other)).status_code == 401
+            )
+
+            time.sleep(args.window + 1.1)
+
+            check(
+                "read after the window is on the replica",
+                await email(client, bearer) == "before@example.com"
+            )
+
+            response = await client.get("/api/v1/accounts/REPLICA-1", headers=bearer)
+            check(
+                "replica reads don't fill the balance cache",
+                response.status_code == 200 and await balance_cache.peek("REPLICA-1") is None
+            )
+
+            async with get_sessionmaker()() as db:
+                await cached_account(db, "REPLICA-1")
+
+            check("primary reads do", await balance_cache.peek("REPLICA-1") is not None)
+
+            response = await client.post(
+                "/api/v1/users/batch-get", json={"keys": ["1-9"]}, headers=bearer
+            )
+            check(
+                "read_only POST is on the replica",
+                response.json()["items"][0]["data"]["email"] == "before@example.com"
+            )
+
+            # Reopened, a missing file is an empty database with no tables
+            os.remove(replica_path)
+            await get_replica().engine.dispose()
+
+            try:
+                status = (await client.get("/api/v1/users/me", headers=bearer)).status_code
+            except OperationalError:
+                # The test transport raises what the app didn't handle
+                status = 500
+
+            check("failing replica request errors", status == 500)
+            check("failing replica is ejected", not replica_stats()[0]["healthy"])
+
+            response = await client.get("/api/v1/users/me", headers=bearer)
+            check(
+                "reads fall back to the primary",
+                response.status_code == 200 and response.json()["email"] == "after@example.com"
+            )
+    finally:
+        await dispose()
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--window", type=float, default=0.5, help="Read-your-writes seconds")
+    args = parser.parse_args()
+
+    primary_path = setup_environment("replica_routing")
+    replica_path = os.path.join(os.path.dirname(primary_path), "replica.db")
+    os.environ["DATABASE_REPLICA_URLS"] = "sqlite+aiosqlite:///%s" % replica_path
+    os.environ["DATABASE_READ_YOUR_WRITES_SECONDS"] = str(args.window)
+
+    failures = asyncio.run(run(args, replica_path))
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
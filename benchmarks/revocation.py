@@ -0,0 +1,104 @@
+"""
+Memory, false positive rate and check cost of the revocation denylist.
+
+`--tokens` revoked token IDs spread over a refresh token lifetime are
+seeded in the table and loaded into the filters. Then tokens that were
+not revoked are checked through `RevocationList.is_revoked` and with a
+plain table lookup, and the filter false positive rate is measured.
+
+    python -m benchmarks.revocation --tokens 1000000
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from .common import setup_environment, create_schema
+
+LIFETIME = 30 * 24 * 3600
+
+
+async def seed(tokens: int, now: int):
+    from sqlalchemy import insert
+
+    from app import models
+    from app.sql import get_sessionmaker
+
+    async with get_sessionmaker()() as db:
+        for start in range(0, tokens, 50000):
+            await db.execute(
+                insert(models.db.RevokedToken),
+                [
+                    dict(jti=uuid.uuid4().hex, expires=now + 1 + i * LIFETIME // tokens, revoked=now)
+                    for i in range(start, min(start + 50000, tokens))
+                ]
+            )
+            await db.commit()
+
+
+async def run(args):
+    from app import models
+    from app.revocation import RevocationList
+    from app.sql import get_engine, get_sessionmaker, dispose
+    from app.util import the_ts_now
+
+    now = the_ts_now()
+    await create_schema(get_engine())
+    await seed(args.tokens, now)
+
+    denylist = RevocationList(3600, args.error_rate, 3600)
+
+    try:
+        async with get_sessionmaker()() as db:
+            started = time.perf_counter()
+            await denylist.sync(db, force=True)
+            print("load        %8.2fs for %d tokens" % (time.perf_counter() - started, args.tokens))
+
+            stats = denylist.stats()
+            print("memory      %8.2fMB, %.1f bits per token, %d buckets" % (
+                stats['bytes'] / 2 ** 20, stats['bytes'] * 8 / stats['tokens'], stats['buckets']
+            ))
+
+            absent = [
+                (uuid.uuid4().hex, now + 1 + i * LIFETIME // args.checks)
+                for i in range(args.checks)
+            ]
+
+            started = time.perf_counter()
+
+            for jti, expires in absent:
+                await denylist.is_revoked(db, jti, expires)
+
+            filtered = (time.perf_counter() - started) / args.checks
+
+            started = time.perf_counter()
+
+            for jti, _ in absent[:args.lookups]:
+                await db.get(models.db.RevokedToken, jti)
+
+            looked_up = (time.perf_counter() - started) / args.lookups
+
+            stats = denylist.stats()
+            print("false positives %.4f%% (target %.4f%%)" % (
+                stats['false_positives'] / args.checks * 100, args.error_rate * 100
+            ))
+            print("is_revoked  %8.2fus/check" % (filtered * 1e6))
+            print("table only  %8.2fus/check" % (looked_up * 1e6))
+    finally:
+        await dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=1000000)
+    parser.add_argument("--checks", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    args = parser.parse_args()
+
+    setup_environment("revocation")
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
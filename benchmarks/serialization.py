@@ -0,0 +1,125 @@
+"""
+Serialization cost of `list_users` pages.
+
+Each page is serialized the way FastAPI does with `response_model`
+(validation, `jsonable_encoder`, then the JSON response) and with
+`TrustedJSONResponse`, both bodies are checked to be the same. Pages
+the API accepts are also requested end to end.
+
+    python -m benchmarks.serialization --sizes 50,100,200,500
+"""
+import argparse
+import asyncio
+import time
+
+import orjson
+
+from .common import setup_environment, create_schema, asgi_client, latency_summary
+
+
+async def seed(users: int):
+    from app import models
+    from app.sql import get_sessionmaker
+
+    async with get_sessionmaker()() as db:
+        db.add_all(
+            models.db.User(
+                first_company_name="Company %05d" % i, first_surname="Surname %05d" % (i % 97),
+                is_company=False, country="CL",
+                country_commercial_id="%d-S" % i, country_personal_id="%d-P" % i,
+                email="serialization%d@example.com" % i, phone="+56 9 1234 5678",
+                address="Serialization street %d" % i
+            )
+            for i in range(users)
+        )
+        await db.commit()
+
+
+async def timed(fn, repeat: int) -> float:
+    started = time.perf_counter()
+
+    for _ in range(repeat):
+        await fn()
+
+    return (time.perf_counter() - started) / repeat
+
+
+async def compare(app, size: int, repeat: int):
+    from fastapi.responses import ORJSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi_pagination import Params
+    from fastapi_pagination.ext.async_sqlalchemy import paginate
+    from sqlalchemy.future import select
+
+    from app import models
+    from app.sql import get_sessionmaker
+    from app.util.serialization import TrustedJSONResponse
+
+    route = next(route for route in app.routes if getattr(route, 'name', None) == 'list_users')
+
+    async with get_sessionmaker()() as db:
+        page = await paginate(
+            db, select(models.db.User).order_by(models.db.User.id),
+            Params.construct(page=1, size=size)
+        )
+
+    async def validated():
+        content = await serialize_response(field=route.secure_cloned_response_field, response_content=page)
+        return ORJSONResponse(content).body
+
+    async def trusted():
+        return TrustedJSONResponse(page, models.User).body
+
+    assert orjson.loads(await validated()) == orjson.loads(await trusted()), "bodies differ"
+
+    slow = await timed(validated, repeat)
+    fast = await timed(trusted, repeat)
+
+    print("%4d items  validated %8.2fms  trusted %8.2fms  %5.1fx" % (
+        size, slow * 1000, fast * 1000, slow / fast
+    ))
+
+
+async def run(args):
+    from app import app
+    from app.sql import get_engine, dispose
+
+    await create_schema(get_engine())
+    await seed(max(args.sizes))
+
+    try:
+        for size in args.sizes:
+            await compare(app, size, args.repeat)
+
+        async with asgi_client(app) as client:
+            for size in (size for size in args.sizes if size <= 100):
+                samples = []
+
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    (await client.get("/api/v1/users", params={"size": size})).raise_for_status()
+                    samples.append(time.perf_counter() - started)
+
+                summary = latency_summary(samples)
+                print("GET /api/v1/users?size=%d  p50 %8.2fms  p95 %8.2fms" % (
+                    size, summary["p50"], summary["p95"]
+                ))
+    finally:
+        await dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=lambda value: [int(size) for size in value.split(",")],
+        default=[50, 100, 200, 500], help="Comma separated page sizes"
+    )
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_environment("serialization")
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+Benchmark suite of the hot API endpoints.
+
+The ASGI app is driven in-process through httpx against a seeded SQLite
+database. Every scenario reports throughput and p50/p95/p99 latency.
+`--save` writes the results as a JSON baseline and `--baseline` fails
+when a scenario's p95 or throughput regresses past `--threshold`.
+
+    python -m benchmarks.suite --save benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --threshold 0.25
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sqlite3
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from .common import setup_environment, create_schema, asgi_client, seed_user, latency_summary
+
+USERNAME = "11111111-1"
+PASSWORD = "suite-password"
+MAIN_ACCOUNT = "SUITE-MAIN"
+
+
+async def seed(users: int, histories: Sequence[int]):
+    from sqlalchemy import insert
+
+    from app import models
+    from app.ledger import checkpoint_accounts
+    from app.sql import get_sessionmaker
+
+    async with get_sessionmaker()() as db:
+        user = await seed_user(db, USERNAME, PASSWORD)
+
+        db.add_all(
+            models.db.User(
+                first_company_name="Company %05d" % i, first_surname="Surname %05d" % (i % 97),
+                is_company=False, country="CL",
+                country_commercial_id="%d-S" % i, country_personal_id="%d-P" % i,
+                email="suite%d@example.com" % i, phone="+56 9 1234 5678",
+                address="Suite street %d" % i
+            )
+            for i in range(users)
+        )
+
+        numbers = [MAIN_ACCOUNT] + ["SUITE-H%d" % size for size in histories]
+
+        for number in numbers:
+            db.add(models.db.Account(
+                number=number, name="Suite %s" % number, country="CL",
+                country_commercial_id="1-9", is_company=False, enabled=True,
+                manager_user=user.id, current_amount=1e9
+            ))
+        await db.flush()
+
+        for number in numbers:
+            db.add(models.db.UserAccounts(user_id=user.id, account_number=number))
+
+        await db.commit()
+
+        # Histories are old enough to be checkpointed
+        for size in histories:
+            await db.execute(
+                insert(models.db.AccountTransaction),
+                [
+                    dict(
+                        account_number="SUITE-H%d" % size, date=1_000_000 + i,
+                        description="suite", amount=1.0
+                    )
+                    for i in range(size)
+                ]
+            )
+            await db.commit()
+
+        await checkpoint_accounts(db)
+
+
+def scenarios(histories: Sequence[int]) -> Dict[str, Callable[[Dict[str, str]], Dict[str, Any]]]:
+    """
+    Request of each scenario, built from the tokens of the user.
+    """
+    detail = dict(name="Suite", country_commercial_id="1-9", note="suite", amount=1.0)
+    bearer = lambda token: {"Authorization": "Bearer %s" % token}
+
+    requests = {
+        "login": lambda tokens: dict(
+            method="POST", url="/api/v1/auth/login",
+            json={"username": USERNAME, "password": PASSWORD}
+        ),
+        # Refresh tokens are rotated, each request spends one
+        "refresh": lambda tokens: dict(
+            method="POST", url="/api/v1/auth/refresh",
+            headers=bearer(next(tokens["refresh_tokens"]))
+        ),
+        "retrieve_account": lambda tokens: dict(
+            method="GET", url="/api/v1/accounts/%s" % MAIN_ACCOUNT,
+            headers=bearer(tokens["access_token"])
+        ),
+        "deposit": lambda tokens: dict(
+            method="POST", url="/api/v1/accounts/%s/deposit" % MAIN_ACCOUNT,
+            json=detail, headers=bearer(tokens["access_token"])
+        ),
+        "withdraw": lambda tokens: dict(
+            method="POST", url="/api/v1/accounts/%s/withdraw" % MAIN_ACCOUNT,
+            json=detail, headers=bearer(tokens["access_token"])
+        ),
+        "list_users": lambda tokens: dict(
+            method="GET", url="/api/v1/users",
+            headers=bearer(tokens["access_token"])
+        ),
+    }
+
+    for size in histories:
+        requests["balance[%d]" % size] = lambda tokens, size=size: dict(
+            method="GET", url="/api/v1/accounts/SUITE-H%d/balance" % size,
+            headers=bearer(tokens["access_token"])
+        )
+        requests["balance[%d] from middle" % size] = lambda tokens, size=size: dict(
+            method="GET", url="/api/v1/accounts/SUITE-H%d/balance" % size,
+            params={"start_ts": 1_000_000 + size // 2},
+            headers=bearer(tokens["access_token"])
+        )
+
+    return requests
+
+
+def refresh_tokens(refresh_token: str, count: int) -> Iterator[str]:
+    """
+    Refresh tokens of the same user as `refresh_token`, one per request.
+    """
+    from fastapi_jwt_auth import AuthJWT
+
+    auth = AuthJWT()
+    claims = auth.get_raw_jwt(refresh_token)
+    user_claims = {'role': claims['role']} if claims.get('role') else {}
+
+    return iter([
+        auth.create_refresh_token(subject=claims['sub'], user_claims=user_claims)
+        for _ in range(count)
+    ])
+
+
+async def measure(
+    client, build: Callable[[Dict[str, Any]], Dict[str, Any]], tokens: Dict[str, Any],
+    requests: int, concurrency: int, warmup: int
+):
+    for _ in range(warmup):
+        (await client.request(**build(tokens))).raise_for_status()
+
+    samples: List[float] = []
+    errors = 0
+    pending = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+
+        for _ in pending:
+            started = time.perf_counter()
+            response = await client.request(**build(tokens))
+            samples.append(time.perf_counter() - started)
+            errors += response.is_error
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return dict(latency_summary(samples), throughput=requests / elapsed, errors=errors)
+
+
+async def run(args) -> Dict[str, Any]:
+    from app import app
+    from app.sql import get_engine, dispose
+
+    await create_schema(get_engine())
+    await seed(args.users, args.history)
+
+    results: Dict[str, Any] = {}
+
+    try:
+        async with asgi_client(app) as client:
+            response = await client.post(
+                "/api/v1/auth/login", json={"username": USERNAME, "password": PASSWORD}
+            )
+            response.raise_for_status()
+            tokens = response.json()
+            tokens["refresh_tokens"] = refresh_tokens(
+                tokens["refresh_token"], args.requests + args.warmup
+            )
+
+            for name, build in scenarios(args.history).items():
+                if args.only and not any(part in name for part in args.only):
+                    continue
+
+                results[name] = await measure(
+                    client, build, tokens, args.requests, args.concurrency, args.warmup
+                )
+                print("%-28s %9.1f req/s  p50 %8.2fms  p95 %8.2fms  p99 %8.2fms%s" % (
+                    name, results[name]["throughput"], results[name]["p50"],
+                    results[name]["p95"], results[name]["p99"],
+                    "  (%d errors)" % results[name]["errors"] if results[name]["errors"] else ""
+                ))
+    finally:
+        await dispose()
+
+    return dict(
+        meta=dict(
+            python=platform.python_version(),
+            sqlite=sqlite3.sqlite_version,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            users=args.users,
+            history=args.history
+        ),
+        results=results
+    )
+
+
+def regressions(run: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    found = []
+
+    for name, result in run["results"].items():
+        base: Optional[Dict[str, float]] = baseline["results"].get(name)
+
+        if base is None:
+            continue
+
+        if result["p95"] > base["p95"] * (1 + threshold):
+            found.append("%s: p95 %.2fms, baseline %.2fms" % (name, result["p95"], base["p95"]))
+
+        if result["throughput"] < base["throughput"] * (1 - threshold):
+            found.append("%s: %.1f req/s, baseline %.1f req/s" % (
+                name, result["throughput"], base["throughput"]
+            ))
+
+        if result["errors"]:
+            found.append("%s: %d errors" % (name, result["errors"]))
+
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument(
+        "--history", type=lambda value: [int(size) for size in value.split(",")],
+        default=[100, 10000, 100000], help="Comma separated transaction counts"
+    )
+    parser.add_argument("--only", nargs="*", help="Run the scenarios containing these names")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed regression ratio")
+    args = parser.parse_args()
+
+    setup_environment("suite")
+    results = asyncio.run(run(args))
+
+    if args.save:
+        with open(args.save, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            found = regressions(results, json.load(baseline), args.threshold)
+
+        if found:
+            print("\nRegressions past %d%%:\n  %s" % (args.threshold * 100, "\n  ".join(found)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()